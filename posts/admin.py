@@ -1,6 +1,15 @@
 from django.contrib import admin
 
-from .models import Group, Post
+from . import export, search
+from .models import Comment, Group, Post
+
+
+def export_action(kind, format):
+    def action(modeladmin, request, queryset):
+        return export.streaming_response(kind, format, queryset)
+    action.short_description = f'Выгрузить выбранные в {format.upper()}'
+    action.__name__ = f'export_{format}'
+    return action
 
 
 @admin.register(Group)
@@ -19,3 +28,28 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ("text",)
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
+    actions = [export_action('posts', format) for format in export.FORMATS]
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо LIKE '%...%'"""
+        if not search_term or not search.index_enabled():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        if not search.has_terms(search_term):
+            return queryset.none(), False
+        return queryset.filter(
+            pk__in=search.matching_ids(search_term)
+        ), False
+
+
+@admin.register(Comment)
+class CommentAdmin(admin.ModelAdmin):
+    """Страница административной панели комментариев"""
+    list_display = ("pk", "text", "created", "author", "post")
+    list_filter = ("created",)
+    raw_id_fields = ("post", "author")
+    empty_value_display = "-пусто-"
+    actions = [
+        export_action('comments', format) for format in export.FORMATS
+    ]
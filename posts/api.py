@@ -0,0 +1,184 @@
+"""
+JSON API лент, постов и комментариев только для чтения.
+
+ETag и Last-Modified ответа считаются по его собственным строкам:
+страница выбирается один раз до сериализации, и ETag — хэш версий её
+строк (id, updated_at, число комментариев), а Last-Modified — самая
+поздняя дата среди них. Запись в другие ленты и посты ответ не
+меняет, а неизменившаяся страница отдаёт 304 без сериализации.
+"""
+import hashlib
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_safe
+
+from .cache import cards_version
+from .lookups import get_author_or_404, get_group_or_404
+from .models import Comment, Post
+from .paginators import COMMENTS_ORDERING, CursorPaginator
+
+
+def index_posts(request):
+    return Post.objects.for_feed()
+
+
+def group_posts(request, slug):
+    group = get_group_or_404(slug)
+    return Post.objects.for_feed().filter(group=group)
+
+
+def profile_posts(request, username):
+    author = get_author_or_404(username)
+    return Post.objects.for_feed().filter(author=author)
+
+
+def post_comments(request, post_id):
+    return Comment.objects.filter(post_id=post_id).select_related('author')
+
+
+def serialize_post(post):
+    return {
+        'id': post.id,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'image': post.image.url if post.image else None,
+        'comments_count': post.comments_count,
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.id,
+        'post': comment.post_id,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+        'author': comment.author.username,
+    }
+
+
+# Поля строк, от которых зависит их представление в ответе. Имена
+# авторов и slug сообществ учитываются версией карточек (cards_version)
+POST_VERSION = ('id', 'updated_at', 'comments_count')
+COMMENT_VERSION = ('id', 'created')
+
+
+def rows_etag(rows, fields, *parts):
+    """ETag из значений fields строк rows и частей parts"""
+    values = [cards_version(), *parts]
+    for row in rows:
+        values.extend(getattr(row, field) for field in fields)
+    raw = ':'.join(str(value) for value in values)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def rows_last_modified(rows, field):
+    """Last-Modified: самая поздняя дата field среди строк rows"""
+    return max((getattr(row, field) for row in rows), default=None)
+
+
+def cursor_page(request, queryset, ordering=None):
+    """
+    Страница по курсору ?after=/?before=. Выбирается один раз за
+    запрос: по ней считаются ETag и Last-Modified, её же сериализует
+    представление
+    """
+    if not hasattr(request, 'api_page'):
+        paginator = CursorPaginator(
+            queryset, settings.POSTS_PER_PAGE, ordering=ordering
+        )
+        request.api_page = paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before')
+        )
+    return request.api_page
+
+
+def paginated(request, page, serialize):
+    """Ответ со страницей page и ссылками на соседние"""
+    return JsonResponse({
+        'results': [serialize(obj) for obj in page],
+        'next': page.next_cursor and '%s?after=%s' % (
+            request.path, page.next_cursor
+        ),
+        'previous': page.previous_cursor and '%s?before=%s' % (
+            request.path, page.previous_cursor
+        ),
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+def page_view(page_func, version, date_field, serialize):
+    """
+    Представление страницы page_func(request, ...) с условным GET.
+    version — поля строк для ETag, date_field — для Last-Modified
+    """
+    def etag(request, *args, **kwargs):
+        page = page_func(request, *args, **kwargs)
+        return rows_etag(page, version, page.has_next(), page.has_previous())
+
+    def last_modified(request, *args, **kwargs):
+        return rows_last_modified(
+            page_func(request, *args, **kwargs), date_field
+        )
+
+    @require_safe
+    @condition(etag, last_modified)
+    def view(request, *args, **kwargs):
+        return paginated(request, page_func(request, *args, **kwargs),
+                         serialize)
+    return view
+
+
+def feed_view(queryset_func):
+    """Представление ленты queryset_func"""
+    def page(request, *args, **kwargs):
+        return cursor_page(request, queryset_func(request, *args, **kwargs))
+    return page_view(page, POST_VERSION, 'updated_at', serialize_post)
+
+
+index = feed_view(index_posts)
+group = feed_view(group_posts)
+profile = feed_view(profile_posts)
+
+
+def feed_post(request, post_id):
+    """Пост ответа; как и страница, выбирается один раз за запрос"""
+    if not hasattr(request, 'api_post'):
+        request.api_post = get_object_or_404(
+            Post.objects.for_feed(), id=post_id
+        )
+    return request.api_post
+
+
+def post_etag(request, post_id):
+    return rows_etag([feed_post(request, post_id)], POST_VERSION)
+
+
+def post_last_modified(request, post_id):
+    return feed_post(request, post_id).updated_at
+
+
+@require_safe
+@condition(post_etag, post_last_modified)
+def post_detail(request, post_id):
+    return JsonResponse(
+        serialize_post(feed_post(request, post_id)),
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def comments_page(request, post_id):
+    if not hasattr(request, 'api_page'):
+        if not Post.objects.filter(id=post_id).exists():
+            raise Http404('Нет такого поста')
+    return cursor_page(
+        request, post_comments(request, post_id), ordering=COMMENTS_ORDERING
+    )
+
+
+comments = page_view(
+    comments_page, COMMENT_VERSION, 'created', serialize_comment
+)
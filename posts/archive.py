@@ -0,0 +1,300 @@
+"""
+Массовая загрузка архивов с других площадок.
+
+Записи читаются потоком из JSONL или CSV и пишутся bulk_create
+пачками, каждая пачка в своей транзакции. Авторы и сообщества
+находятся по словарям username -> pk и slug -> pk в памяти;
+недостающие авторы создаются без пароля. Сигналы при bulk_create
+не вызываются, поэтому счётчики, поисковый индекс, рейтинги и ленты
+подписок обновляются один раз в finish() — только для пользователей,
+затронутых загрузкой (авторы постов и комментариев, участники
+подписок), и их постов; finish(full=True) перестраивает всё.
+
+Номер последней записанной записи каждого файла и затронутые
+пользователи сохраняются в файле контрольной точки, и прерванная
+загрузка продолжается с неё.
+Посты и комментарии сохраняют id из архива (комментарии ссылаются
+на посты по этим id), а повторно записанные строки пропускаются,
+поэтому повтор пачки после сбоя безопасен. Строка базы с тем же id,
+но другим содержимым — чужая запись: загрузка останавливается с
+ArchiveError, иначе комментарии архива попали бы к чужому посту.
+"""
+import csv
+import itertools
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import search, timeline, trending
+from .bulk import batches, explicit_timestamps
+from .cache import invalidate_feeds
+from .counters import recount_comments, recount_user_stats
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+KINDS = ('groups', 'posts', 'comments', 'follows')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def read_records(path):
+    """Записи файла по одной: CSV по расширению, иначе JSONL"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def parse_date(value):
+    """
+    Дата из ISO 8601; без часового пояса считается в TIME_ZONE.
+    Запись без даты отклоняется: подставленное текущее время не
+    совпало бы при повторе пачки (check_ids)
+    """
+    if not value:
+        raise ArchiveError('Нет даты')
+    date = parse_datetime(value)
+    if date is None:
+        raise ArchiveError(f'Некорректная дата: {value!r}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Checkpoint:
+    """
+    Число загруженных записей каждого файла и id затронутых
+    пользователей, хранится в JSON
+    """
+    USERS_KEY = 'users'
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+        self.users = set(self.data.get(self.USERS_KEY, ()))
+
+    def done(self, key):
+        return self.data.get(key, 0)
+
+    def save(self, key, count):
+        self.data[key] = count
+        self.data[self.USERS_KEY] = sorted(self.users)
+        if not self.path:
+            return
+        # Через временный файл, чтобы сбой не оставил половину JSON
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        self.data = {}
+        self.users = set()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def check_ids(model, objects, fields):
+    """
+    Строки model с id из objects должны совпадать с ними по fields:
+    совпадающие — уже загруженные при повторе пачки, остальные — чужие
+    """
+    ids = [obj.id for obj in objects if obj.id is not None]
+    if not ids:
+        return
+    existing = {
+        row[0]: row[1:]
+        for row in model.objects.filter(id__in=ids).values_list(
+            'id', *fields
+        )
+    }
+    for obj in objects:
+        if obj.id in existing and existing[obj.id] != tuple(
+                getattr(obj, field) for field in fields):
+            raise ArchiveError(
+                f'{model._meta.verbose_name} с id {obj.id} уже есть в '
+                f'базе и не совпадает с записью архива'
+            )
+
+
+class ArchiveImporter:
+    def __init__(self, batch_size=5000, checkpoint=None, report=None):
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.report = report or (lambda *args: None)
+        self._users = None
+        self._groups = None
+
+    def user_ids(self, usernames):
+        """username -> pk; недостающие пользователи создаются"""
+        if self._users is None:
+            self._users = dict(User.objects.values_list('username', 'pk'))
+        missing = {
+            name for name in usernames if name not in self._users
+        }
+        if missing:
+            User.objects.bulk_create(
+                (User(username=name, password=make_password(None))
+                 for name in sorted(missing)),
+                ignore_conflicts=True
+            )
+            self._users.update(User.objects.filter(
+                username__in=missing
+            ).values_list('username', 'pk'))
+        return self._users
+
+    def group_ids(self):
+        if self._groups is None:
+            self._groups = dict(Group.objects.values_list('slug', 'pk'))
+        return self._groups
+
+    def import_file(self, kind, path):
+        """Загружает файл записей вида kind; возвращает число записей"""
+        if kind not in KINDS:
+            raise ArchiveError(f'Неизвестный вид записей: {kind}')
+        write = getattr(self, 'write_' + kind)
+        key = f'{kind}:{os.path.abspath(path)}'
+        count = self.checkpoint.done(key)
+        records = itertools.islice(read_records(path), count, None)
+        started = time.perf_counter()
+        imported = 0
+        for batch in batches(records, self.batch_size):
+            try:
+                with transaction.atomic():
+                    write(batch)
+            except (ArchiveError, IntegrityError, KeyError,
+                    ValueError) as error:
+                raise ArchiveError(
+                    f'{path}, записи {count + 1}-{count + len(batch)}: '
+                    f'{error!r}'
+                ) from error
+            count += len(batch)
+            imported += len(batch)
+            self.checkpoint.save(key, count)
+            self.report(kind, path, count, imported,
+                        time.perf_counter() - started)
+        return imported
+
+    def write_groups(self, batch):
+        Group.objects.bulk_create((
+            Group(
+                title=record['title'],
+                slug=record['slug'],
+                description=record.get('description') or '',
+            )
+            for record in batch
+        ), ignore_conflicts=True)
+        self._groups = None
+
+    def write_posts(self, batch):
+        users = self.user_ids(record['author'] for record in batch)
+        groups = self.group_ids()
+        posts = []
+        for record in batch:
+            group = record.get('group')
+            if group and group not in groups:
+                raise ArchiveError(f'Нет сообщества {group!r}')
+            pub_date = parse_date(record.get('pub_date'))
+            self.checkpoint.users.add(users[record['author']])
+            posts.append(Post(
+                id=int(record['id']) if record.get('id') else None,
+                text=record['text'],
+                author_id=users[record['author']],
+                group_id=groups[group] if group else None,
+                pub_date=pub_date,
+                updated_at=pub_date,
+                image=record.get('image') or None,
+            ))
+        check_ids(Post, posts, ('author_id', 'pub_date', 'text'))
+        with explicit_timestamps(Post):
+            Post.objects.bulk_create(posts, ignore_conflicts=True)
+
+    def write_comments(self, batch):
+        users = self.user_ids(record['author'] for record in batch)
+        self.checkpoint.users.update(
+            users[record['author']] for record in batch
+        )
+        comments = [
+            Comment(
+                id=int(record['id']) if record.get('id') else None,
+                post_id=int(record['post']),
+                text=record['text'],
+                author_id=users[record['author']],
+                created=parse_date(record.get('created')),
+            )
+            for record in batch
+        ]
+        check_ids(
+            Comment, comments, ('post_id', 'author_id', 'created', 'text')
+        )
+        with explicit_timestamps(Comment):
+            Comment.objects.bulk_create(comments, ignore_conflicts=True)
+
+    def write_follows(self, batch):
+        users = self.user_ids(itertools.chain.from_iterable(
+            (record['user'], record['author']) for record in batch
+        ))
+        follows = [
+            Follow(
+                user_id=users[record['user']],
+                author_id=users[record['author']],
+            )
+            for record in batch
+            if record['user'] != record['author']
+        ]
+        for follow in follows:
+            self.checkpoint.users.update((follow.user_id, follow.author_id))
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+
+    def finish(self, full=False):
+        """
+        Отложенное обслуживание после загрузки: последовательности id,
+        счётчики, поисковый индекс, рейтинги, ленты подписок и кэш лент.
+        Без full — только для затронутых пользователей и их постов
+        """
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Post, Comment]):
+                cursor.execute(sql)
+        users = posts = readers = None
+        if not full:
+            ids = sorted(self.checkpoint.users)
+            users = User.objects.filter(pk__in=ids)
+            # Посты затронутых авторов и посты с их комментариями
+            posts = Post.objects.filter(Q(author_id__in=ids) | Q(
+                pk__in=Comment.objects.filter(
+                    author_id__in=ids
+                ).values('post_id')
+            ))
+            # Ленты подписок затронутых читателей и подписчиков авторов
+            readers = User.objects.filter(Q(pk__in=ids) | Q(
+                pk__in=Follow.objects.filter(
+                    author_id__in=ids
+                ).values('user_id')
+            ))
+        with transaction.atomic():
+            recount_user_stats(users)
+            recount_comments(posts)
+            search.rebuild(posts)
+            trending.refresh(posts)
+            if timeline.timeline_enabled():
+                timeline.rebuild(readers)
+        invalidate_feeds()
@@ -0,0 +1,157 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+
+from . import search, timeline, trending
+from .bulk import batches, explicit_timestamps
+from .counters import recount_comments, recount_user_stats
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@contextmanager
+def scratch_database(file_backed=False):
+    """
+    Создаёт временную тестовую базу на время замера,
+    чтобы синтетические данные не попадали в рабочую.
+    file_backed: тестовая база SQLite в файле, а не в памяти, —
+    для замеров с несколькими потоками
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict['TEST']
+    old_test_name = test_settings.get('NAME')
+    if file_backed and connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp()
+        test_settings['NAME'] = os.path.join(directory, 'bench.sqlite3')
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if test_settings.get('NAME') != old_test_name:
+            shutil.rmtree(os.path.dirname(test_settings['NAME']))
+            test_settings['NAME'] = old_test_name
+
+
+def seed_posts(count, authors=10, batch_size=5000, text=None):
+    """
+    Массово создаёт авторов и count постов с убывающими датами;
+    text(i) задаёт текст i-го поста
+    """
+    if text is None:
+        text = 'Синтетический пост {}'.format
+    users = User.objects.bulk_create(
+        User(username=f'bench_author_{i}') for i in range(authors)
+    )
+    users = list(User.objects.filter(
+        username__in=[user.username for user in users]
+    ))
+    start = timezone.now() - timedelta(seconds=count)
+    with explicit_timestamps(Post):
+        for offset in range(0, count, batch_size):
+            Post.objects.bulk_create(
+                Post(
+                    text=text(i),
+                    author=users[i % len(users)],
+                    pub_date=start + timedelta(seconds=i),
+                    updated_at=start + timedelta(seconds=i),
+                )
+                for i in range(offset, min(offset + batch_size, count))
+            )
+
+
+def seed_site(users, groups, posts, comments, follows,
+              batch_size=5000, seed=0):
+    """
+    Массово создаёт пользователей, сообщества, посты, комментарии
+    и подписки в заданных количествах, затем пересчитывает счётчики,
+    поисковый индекс и ленты подписок. Одинаковый seed даёт
+    одинаковые данные, поэтому замеры на разных коммитах сравнимы.
+    Возвращает список созданных пользователей
+    """
+    rnd = random.Random(seed)
+    User.objects.bulk_create(
+        (User(username=f'bench_user_{i}') for i in range(users)),
+        batch_size=batch_size
+    )
+    user_ids = list(User.objects.filter(
+        username__startswith='bench_user_'
+    ).order_by('pk').values_list('pk', flat=True))
+    Group.objects.bulk_create(
+        Group(title=f'Сообщество {i}', slug=f'bench-group-{i}')
+        for i in range(groups)
+    )
+    group_ids = list(Group.objects.filter(
+        slug__startswith='bench-group-'
+    ).values_list('pk', flat=True)) + [None]
+
+    start = timezone.now() - timedelta(seconds=posts + comments)
+    with explicit_timestamps(Post):
+        for batch in batches((
+            Post(
+                text=f'Синтетический пост {i}',
+                author_id=rnd.choice(user_ids),
+                group_id=rnd.choice(group_ids),
+                pub_date=start + timedelta(seconds=i),
+                updated_at=start + timedelta(seconds=i),
+            )
+            for i in range(posts)
+        ), batch_size):
+            Post.objects.bulk_create(batch)
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    with explicit_timestamps(Comment):
+        for batch in batches((
+            Comment(
+                text=f'Синтетический комментарий {i}',
+                author_id=rnd.choice(user_ids),
+                post_id=rnd.choice(post_ids),
+                created=start + timedelta(seconds=posts + i),
+            )
+            for i in range(comments)
+        ), batch_size):
+            Comment.objects.bulk_create(batch)
+    pairs = set()
+    while len(pairs) < min(follows, len(user_ids) * (len(user_ids) - 1)):
+        user_id, author_id = rnd.sample(user_ids, 2)
+        pairs.add((user_id, author_id))
+    for batch in batches((
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id, author_id in sorted(pairs)
+    ), batch_size):
+        Follow.objects.bulk_create(batch, ignore_conflicts=True)
+
+    recount_user_stats()
+    recount_comments()
+    search.rebuild()
+    trending.refresh()
+    if timeline.timeline_enabled():
+        timeline.rebuild()
+    return list(User.objects.filter(pk__in=user_ids).order_by('pk'))
+
+
+def percentile(timings, q):
+    """Перцентиль q (0..100) отсортированного списка"""
+    index = min(len(timings) - 1, int(round(q / 100 * (len(timings) - 1))))
+    return timings[index]
+
+
+def measure(func, repeat=20):
+    """Медиана времени выполнения func в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
@@ -0,0 +1,33 @@
+from contextlib import contextmanager
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """
+    Временно отключает auto_now/auto_now_add у полей модели,
+    чтобы bulk_create сохранял переданные даты как есть
+    """
+    saved = []
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now', False) or getattr(
+                field, 'auto_now_add', False):
+            saved.append((field, field.auto_now, field.auto_now_add))
+            field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+def batches(objects, batch_size):
+    """Разбивает поток объектов на списки по batch_size"""
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
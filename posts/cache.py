@@ -0,0 +1,163 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+from yatube import replicas
+from . import profiling
+
+HITS_KEY = 'feed_cache:hits'
+MISSES_KEY = 'feed_cache:misses'
+CHANGED_KEY = 'feed_cache:changed_at'
+CARDS_VERSION_KEY = 'feed_cache:cards_version'
+SCOPE_KEY = 'feed_cache:scope:%s'
+# Область, от которой зависят все страницы (invalidate_feeds)
+ALL_SCOPE = 'all'
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключа ещё нет (или он вытеснен) — начинаем счёт заново
+        cache.add(key, 1, None)
+        return 1
+
+
+def cards_version():
+    """
+    Версия карточек постов (posts.cards); меняется при изменении
+    авторов и сообществ, имена которых есть в карточках
+    """
+    version = cache.get(CARDS_VERSION_KEY)
+    if version is None:
+        cache.add(CARDS_VERSION_KEY, 1, None)
+        version = cache.get(CARDS_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_cards():
+    _incr(CARDS_VERSION_KEY)
+
+
+def post_scopes(post, group_ids=()):
+    """
+    Области, в которых виден пост: общая лента, профиль автора,
+    сообщество (и прежние сообщества group_ids) и страница поста
+    """
+    scopes = {'index', f'author:{post.author_id}', f'post:{post.pk}'}
+    scopes.update(
+        f'group:{group_id}'
+        for group_id in (post.group_id, *group_ids) if group_id
+    )
+    return scopes
+
+
+def scope_versions(scopes):
+    """
+    Версии областей лент scopes одним get_many. Область — то, от чего
+    зависит страница: общая лента ('index'), сообщество ('group:<id>'),
+    автор ('author:<id>'), пост ('post:<id>'), подписки читателя
+    ('follower:<id>'), рейтинги ('trending'); все страницы зависят ещё
+    и от ALL_SCOPE. Версия — время последнего изменения области;
+    неизвестная версия (кэш очищен) считается изменением сейчас
+    """
+    keys = [SCOPE_KEY % scope for scope in (ALL_SCOPE, *scopes)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time(), None)
+            versions[key] = cache.get(key, time.time())
+    return [versions[key] for key in keys]
+
+
+def changed_at(versions):
+    """Время последнего изменения областей с версиями versions (UTC)"""
+    return datetime.fromtimestamp(max(versions), timezone.utc)
+
+
+def invalidate_scopes(*scopes):
+    """Делает недействительными фрагменты и ETag страниц областей"""
+    now = time.time()
+    cache.set_many({SCOPE_KEY % scope: now for scope in scopes}, None)
+    if replicas.replica_alias() is not None:
+        cache.set(CHANGED_KEY, now, None)
+
+
+def invalidate_feeds():
+    """Делает недействительными все закэшированные фрагменты лент"""
+    invalidate_scopes(ALL_SCOPE)
+
+
+def feeds_settling():
+    """
+    Ленты только что изменились, а запрос читает с реплики, которая
+    может ещё не получить изменения. Такую страницу нельзя надолго
+    кэшировать под новой версией лент
+    """
+    if not replicas.reading_from_replica():
+        return False
+    changed = cache.get(CHANGED_KEY)
+    return changed is not None and (
+        time.time() - changed < settings.REPLICA_STICKY_SECONDS
+    )
+
+
+def feed_cache_key(view, request, scopes):
+    """
+    Ключ фрагмента ленты: представление, его области с их версиями
+    (в именах областей — сообщество и автор), страница или курсор,
+    целая страница или только карточки (load_more.html) и зритель.
+    Зритель нужен, потому что автор видит в своих карточках кнопку
+    «Редактировать».
+    """
+    page = request.GET.get('page', '1')
+    parts = [
+        view,
+        *scopes,
+        *scope_versions(scopes),
+        request.user.pk if request.user.is_authenticated else 0,
+        page if page.isdigit() else '1',
+        request.GET.get('after', ''),
+        request.GET.get('before', ''),
+        'fragment' in request.GET,
+    ]
+    raw = ':'.join(str(part) for part in parts)
+    return 'feed_fragment:%s:%s' % (
+        view, hashlib.md5(raw.encode()).hexdigest()
+    )
+
+
+def get_fragment(key):
+    """Возвращает HTML фрагмента или None, учитывая попадания и промахи"""
+    html = cache.get(key)
+    _incr(MISSES_KEY if html is None else HITS_KEY)
+    profiling.record_cache('feed', html is not None)
+    return html
+
+
+def set_fragment(key, html):
+    timeout = settings.FEED_CACHE_TIMEOUT
+    if feeds_settling():
+        timeout = settings.REPLICA_STICKY_SECONDS
+    cache.set(key, html, timeout)
+
+
+def feed_cache_stats():
+    """
+    Счётчики попаданий и промахов кэша лент для мониторинга: общие
+    для всех процессов и, при двухуровневом кэше, по уровням в этом
+    процессе
+    """
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    tier_stats = getattr(cache, 'tier_stats', None)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+        'tiers': tier_stats() if tier_stats else {},
+    }
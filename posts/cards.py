@@ -0,0 +1,94 @@
+"""
+Кэш карточек постов (post_item.html).
+
+Карточка одинакова для всех зрителей, кроме кнопки «Редактировать»
+у автора: в кэше вместо неё стоит ACTIONS_MARKER, который заменяется
+при выводе. Ключ карточки включает id поста, updated_at, число
+комментариев и версию карточек (posts.cache.cards_version), поэтому
+изменённая карточка просто получает новый ключ. Карточки страницы
+читаются одним get_many, рендерятся и записываются set_many только
+недостающие, а их миниатюры читаются вместе (attach_thumbnails).
+
+Карточка с картинкой, миниатюра которой ещё не готова, ссылается на
+оригинал и не кэшируется, как и фрагмент ленты с ней (feedcache).
+Если миниатюру создать не удалось (posts.thumbnails.failed_images),
+карточка с оригиналом кэшируется: ждать больше нечего.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from . import profiling, thumbnails
+from .cache import cards_version
+
+# Метка в HTML карточки; текст поста экранирован и не может её содержать
+ACTIONS_MARKER = '<!-- post-actions -->'
+
+
+def card_key(post, version):
+    raw = '%s:%s:%s:%s' % (
+        post.pk, post.updated_at.isoformat(), post.comments_count, version
+    )
+    return 'post_card:%s:%s' % (
+        post.pk, hashlib.md5(raw.encode()).hexdigest()
+    )
+
+
+def render_card(post):
+    """
+    HTML карточки без кнопок зрителя и можно ли его кэшировать.
+    Миниатюра берётся из post.card_thumbnail (attach_thumbnails)
+    """
+    thumbnail = getattr(post, 'card_thumbnail', None)
+    html = render_to_string('post_item.html', {'post': post})
+    return html, not post.image or thumbnail is not None
+
+
+def viewer_actions(post, user):
+    """Кнопки карточки, которые видит только зритель user"""
+    if user is None or user.pk != post.author_id:
+        return ''
+    return format_html(
+        '<a class="btn btn-sm btn-info" href="{}" role="button">'
+        'Редактировать</a>',
+        reverse('post_edit', args=(post.author.username, post.pk))
+    )
+
+
+def render_cards(posts, user=None, fragment=None):
+    """
+    Карточки постов posts для зрителя user одной строкой HTML.
+    fragment — состояние фрагмента ленты (feedcache), в который
+    выводятся карточки: с незакэшированной карточкой он не кэшируется
+    """
+    posts = list(posts)
+    version = cards_version()
+    keys = [card_key(post, version) for post in posts]
+    cached = cache.get_many(keys)
+    missing = [
+        post for post, key in zip(posts, keys) if key not in cached
+    ]
+    thumbnails.attach_thumbnails(missing, 'card')
+    failed = thumbnails.enqueue_missing(missing, 'card')
+    rendered = {}
+    cards = []
+    for post, key in zip(posts, keys):
+        html = cached.get(key)
+        profiling.record_cache('card', html is not None)
+        if html is None:
+            html, cacheable = render_card(post)
+            if cacheable or post.image.name in failed:
+                rendered[key] = html
+            elif fragment is not None:
+                fragment['cacheable'] = False
+        cards.append(html.replace(
+            ACTIONS_MARKER, viewer_actions(post, user), 1
+        ))
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+    return mark_safe(''.join(cards))
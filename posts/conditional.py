@@ -0,0 +1,71 @@
+"""
+Условный GET для HTML-страниц.
+
+Страница зависит от областей лент (posts.cache.scope_versions): общей
+ленты, сообщества, автора, поста. Их версии меняют сигналы только при
+записи в эти области, поэтому комментарий к одному посту не меняет
+страницы других сообществ и авторов. ETag строится из версий областей
+страницы, зрителя и адреса, Last-Modified — время последнего изменения
+этих областей. Оба значения берутся из кэша без запросов к базе до
+выборки и отрисовки, поэтому неизменившаяся страница отдаёт 304 без
+шаблона.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .cache import changed_at, feeds_settling, scope_versions
+
+
+def _digest(*parts):
+    if feeds_settling():
+        # Страница с отстающей реплики не должна получить ETag
+        # новой версии лент, иначе её будут подтверждать через 304
+        parts += (uuid.uuid4(),)
+    raw = ':'.join(str(part) for part in parts)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def conditional_page(scopes_func):
+    """
+    condition() для HTML-страниц с областями scopes_func(request, ...).
+    Ответ (и 304) можно хранить только с повторной проверкой, а
+    страницу вошедшего пользователя — только в его браузере
+    """
+    def versions(request, *args, **kwargs):
+        # Версии читаются один раз для ETag и Last-Modified
+        if not hasattr(request, 'scope_versions'):
+            request.scope_versions = scope_versions(
+                scopes_func(request, *args, **kwargs)
+            )
+        return request.scope_versions
+
+    def etag(request, *args, **kwargs):
+        viewer = request.user.pk if request.user.is_authenticated else 0
+        return _digest(
+            *versions(request, *args, **kwargs),
+            viewer, request.get_full_path()
+        )
+
+    def last_modified(request, *args, **kwargs):
+        return changed_at(versions(request, *args, **kwargs))
+
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=etag, last_modified_func=last_modified
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Cookie',))
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+def _count_of(queryset, field):
+    """Число строк queryset, ссылающихся полем field на внешнюю строку"""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def change_user_stats(user_id, **deltas):
+    """Сдвигает счётчики пользователя одним UPDATE"""
+    updated = UserStats.objects.filter(user_id=user_id).update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+    # Строку без счётчиков создаём только при увеличении: при удалении
+    # пользователя его счётчики могут быть уже удалены каскадом
+    if not updated and all(delta > 0 for delta in deltas.values()):
+        recount_user_stats(User.objects.filter(pk=user_id))
+
+
+def change_comments_count(post_id, delta):
+    # Число комментариев есть в карточке и в API, поэтому меняет и
+    # версию поста (updated_at)
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta,
+        updated_at=timezone.now()
+    )
+
+
+def _repair(queryset, expressions):
+    """Пересчитывает поля queryset; возвращает число исправленных строк"""
+    actual = {'actual_' + field: expr for field, expr in expressions.items()}
+    consistent = Q()
+    for field in expressions:
+        consistent &= Q(**{field: F('actual_' + field)})
+    stale = queryset.annotate(**actual).exclude(consistent).count()
+    if stale:
+        queryset.update(**expressions)
+    return stale
+
+
+def recount_user_stats(users=None):
+    """
+    Создаёт недостающие строки UserStats и пересчитывает счётчики
+    пользователей; возвращает число исправленных строк
+    """
+    if users is None:
+        users = User.objects.all()
+    missing = users.filter(stats__isnull=True).values_list('pk', flat=True)
+    batch = []
+    for pk in missing.iterator(chunk_size=BATCH_SIZE):
+        batch.append(UserStats(user_id=pk))
+        if len(batch) == BATCH_SIZE:
+            UserStats.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    UserStats.objects.bulk_create(batch, ignore_conflicts=True)
+    return _repair(UserStats.objects.filter(user__in=users), {
+        'posts_count': _count_of(Post.objects.all(), 'author'),
+        'followers_count': _count_of(Follow.objects.all(), 'author'),
+        'following_count': _count_of(Follow.objects.all(), 'user'),
+    })
+
+
+def recount_comments(posts=None):
+    """Пересчитывает число комментариев постов"""
+    if posts is None:
+        posts = Post.objects.all()
+    return _repair(posts.order_by(), {
+        'comments_count': _count_of(Comment.objects.all(), 'post'),
+    })
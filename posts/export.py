@@ -0,0 +1,122 @@
+"""
+Потоковая выгрузка постов и комментариев в CSV или JSONL.
+
+Таблица обходится окнами по первичному ключу (keyset), каждое окно
+читается iterator(chunk_size=...) в виде словарей, без моделей,
+поэтому расход памяти не зависит от размера таблицы. Поля
+совпадают с форматом import_archive, и выгрузку можно загрузить
+обратно.
+"""
+import csv
+import io
+import json
+
+from django.http import StreamingHttpResponse
+
+from .models import Comment, Post
+
+CHUNK_SIZE = 2000
+
+# вид -> (модель, поле даты, поля выгрузки: имя -> путь в values())
+KINDS = {
+    'posts': (Post, 'pub_date', {
+        'id': 'id',
+        'text': 'text',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'pub_date': 'pub_date',
+        'image': 'image',
+    }),
+    'comments': (Comment, 'created', {
+        'id': 'id',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    }),
+}
+FORMATS = ('csv', 'jsonl')
+
+
+def export_queryset(kind, group=None, author=None, since=None, until=None):
+    """
+    Выгружаемые записи вида kind: сообщество — поста (или поста
+    комментария), автор и даты — самой записи
+    """
+    model, date_field, _ = KINDS[kind]
+    queryset = model.objects.all()
+    if group:
+        queryset = queryset.filter(**{
+            'group__slug' if model is Post else 'post__group__slug': group
+        })
+    if author:
+        queryset = queryset.filter(author__username=author)
+    if since:
+        queryset = queryset.filter(**{date_field + '__gte': since})
+    if until:
+        queryset = queryset.filter(**{date_field + '__lt': until})
+    return queryset
+
+
+def iter_rows(kind, queryset, chunk_size=CHUNK_SIZE):
+    """Записи словарями в порядке id, окнами по chunk_size"""
+    fields = KINDS[kind][2]
+    values = queryset.order_by('pk').values('pk', *fields.values())
+    last = None
+    while True:
+        window = values if last is None else values.filter(pk__gt=last)
+        count = 0
+        for row in window[:chunk_size].iterator(chunk_size=chunk_size):
+            count += 1
+            last = row['pk']
+            yield {name: row[path] for name, path in fields.items()}
+        if count < chunk_size:
+            return
+
+
+def _plain(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return '' if value is None else value
+
+
+def iter_csv(kind, rows):
+    """Строки CSV с заголовком"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(KINDS[kind][2]))
+    writer.writeheader()
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow({name: _plain(value) for name, value in row.items()})
+        yield buffer.getvalue()
+
+
+def iter_jsonl(kind, rows):
+    for row in rows:
+        yield json.dumps({
+            name: None if value is None else _plain(value)
+            for name, value in row.items()
+        }, ensure_ascii=False) + '\n'
+
+
+def iter_export(kind, format, queryset, chunk_size=CHUNK_SIZE):
+    """Выгрузка queryset вида kind в формате format по строкам"""
+    serialize = iter_csv if format == 'csv' else iter_jsonl
+    return serialize(kind, iter_rows(kind, queryset, chunk_size))
+
+
+def streaming_response(kind, format, queryset):
+    """Выгрузка как StreamingHttpResponse с файлом для скачивания"""
+    response = StreamingHttpResponse(
+        iter_export(kind, format, queryset),
+        content_type=(
+            'text/csv; charset=utf-8' if format == 'csv'
+            else 'application/x-ndjson; charset=utf-8'
+        )
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{kind}.{format}"'
+    )
+    return response
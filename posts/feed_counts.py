@@ -0,0 +1,113 @@
+"""
+Число постов лент для навигации по номерам страниц.
+
+Точный COUNT(*) на каждый запрос не нужен: от числа постов зависят
+только номера страниц в paginator.html (FeedPaginator сам проверяет
+наличие следующей страницы по выборке). Поэтому число хранится в
+кэше; значение старше FEED_COUNT_TIMEOUT отдаётся как есть, а точное
+пересчитывается в фоновом потоке. Для ленты без фильтров при пустом
+кэше берётся оценка из статистики планировщика (sqlite_stat1 после
+ANALYZE, pg_class.reltuples в PostgreSQL).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'feed_count:'
+# Сколько хранится последнее известное число, даже устаревшее
+STALE_TIMEOUT = 60 * 60 * 24
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def estimated_count(model):
+    """Число строк таблицы модели по статистике планировщика или None"""
+    connection = connections[router.db_for_read(model)]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            )
+            if cursor.fetchone() is None:
+                return None
+            # Первое число stat — строк в таблице (индексе)
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                [table]
+            )
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [table]
+            )
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] >= 0 else None
+    return None
+
+
+def _store(key, count):
+    cache.set(KEY_PREFIX + key, (count, time.time()), STALE_TIMEOUT)
+    return count
+
+
+def _refresh(key, queryset):
+    try:
+        _store(key, queryset.count())
+    except Exception:
+        logger.exception('Не удалось пересчитать посты ленты %s', key)
+    finally:
+        cache.delete(KEY_PREFIX + key + ':refreshing')
+        # У каждого потока пула своё соединение с базой
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='feed_counts'
+            )
+        return _executor
+
+
+def schedule(key, queryset):
+    """Пересчитывает число в фоне, если пересчёт ещё не запущен"""
+    queryset = queryset.order_by()
+    if settings.FEED_COUNT_REFRESH == 'sync':
+        _store(key, queryset.count())
+        return
+    if cache.add(KEY_PREFIX + key + ':refreshing', 1,
+                 settings.FEED_COUNT_TIMEOUT):
+        _get_executor().submit(_refresh, key, queryset)
+
+
+def feed_count(key, queryset, estimate=False):
+    """
+    Число записей queryset ленты key. estimate=True разрешает при
+    пустом кэше оценку по статистике (только для queryset без
+    фильтров)
+    """
+    entry = cache.get(KEY_PREFIX + key)
+    if entry is not None:
+        count, counted_at = entry
+        if time.time() - counted_at > settings.FEED_COUNT_TIMEOUT:
+            schedule(key, queryset)
+        return count
+    if estimate:
+        count = estimated_count(queryset.model)
+        if count is not None:
+            schedule(key, queryset)
+            return count
+    return _store(key, queryset.order_by().count())
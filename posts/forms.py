@@ -1,5 +1,7 @@
+from .images import read_meta, set_meta
 from .models import Post, Comment
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
 
@@ -15,6 +17,22 @@ class PostForm(ModelForm):
         model = Post
         fields = ['group', 'text', 'image']
 
+    def clean_image(self):
+        """Размеры и заглушка новой картинки для полей поста"""
+        image = self.cleaned_data['image']
+        self.image_meta = None
+        if isinstance(image, UploadedFile):
+            try:
+                self.image_meta = read_meta(image)
+            except OSError:
+                raise forms.ValidationError('Не удалось прочитать картинку')
+        return image
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            set_meta(self.instance, self.image_meta)
+        return super().save(commit)
+
 
 class CommentForm(ModelForm):
     """Форма создания Комментария"""
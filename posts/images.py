@@ -0,0 +1,62 @@
+"""
+Размеры, объём и заглушка картинки поста.
+
+Считаются один раз при сохранении PostForm, для старых и загруженных
+import_archive постов — командой backfill_image_meta, и хранятся в
+полях Post (для нечитаемого файла — failed_meta). Карточки выводят
+по ним width/height и размытую заглушку до загрузки картинки, не
+открывая файл.
+"""
+import base64
+import io
+
+from PIL import Image
+
+# Сторона заглушки в пикселях; в карточке она растягивается на картинку
+PLACEHOLDER_SIZE = 16
+FIELDS = ('image_width', 'image_height', 'image_size', 'image_placeholder')
+
+
+def read_meta(file):
+    """Поля FIELDS для файла картинки file"""
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        # JPEG декодируется сразу в уменьшенном виде
+        image.draft('RGB', (PLACEHOLDER_SIZE * 2, PLACEHOLDER_SIZE * 2))
+        preview = image.convert('RGB')
+    preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = io.BytesIO()
+    preview.save(buffer, 'JPEG', quality=50)
+    file.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': file.size,
+        'image_placeholder': 'data:image/jpeg;base64,' + base64.b64encode(
+            buffer.getvalue()
+        ).decode(),
+    }
+
+
+def empty_meta():
+    return {
+        'image_width': None,
+        'image_height': None,
+        'image_size': None,
+        'image_placeholder': '',
+    }
+
+
+def failed_meta():
+    """
+    Отметка нечитаемой картинки: размеров нет, а нулевой объём
+    говорит backfill_image_meta не читать файл снова
+    """
+    return dict(empty_meta(), image_size=0)
+
+
+def set_meta(post, meta):
+    """Записывает meta (или пустые значения) в поля поста"""
+    for field, value in (meta or empty_meta()).items():
+        setattr(post, field, value)
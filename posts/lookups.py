@@ -0,0 +1,72 @@
+"""
+Кэш поиска сообщества по slug и автора по имени.
+
+Сообщества и пользователи меняются редко, а ленты ищут их на каждом
+запросе. Найденный объект хранится LOOKUP_CACHE_TIMEOUT секунд,
+отсутствие — LOOKUP_MISS_TIMEOUT секунд, чтобы поток запросов к
+несуществующим адресам не доходил до базы. Записи сбрасываются
+сигналами (posts.signals) при сохранении и удалении, в том числе
+под прежним адресом, если slug или имя поменялись.
+
+Ключи не попадают в память процесса двухуровневого кэша
+(yatube.caches.LOCAL_PREFIXES), поэтому сброс виден всем процессам.
+У пользователя в кэш попадают только поля CACHED_USER_FIELDS: хэш
+пароля и почта не должны лежать в общем кэше.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import Http404
+
+from . import profiling
+from .models import Group
+
+User = get_user_model()
+
+# Отметка «такого нет»; None кэш возвращает и для отсутствующего ключа
+MISSING = False
+# Поля пользователя, нужные лентам и профилю
+CACHED_USER_FIELDS = ('id', 'username', 'first_name', 'last_name')
+
+
+def lookup_key(model, value):
+    digest = hashlib.md5(str(value).encode()).hexdigest()
+    return 'lookup:%s:%s' % (model._meta.label_lower, digest)
+
+
+def _get(queryset, field, value):
+    model = queryset.model
+    key = lookup_key(model, value)
+    instance = cache.get(key)
+    profiling.record_cache('lookup', instance is not None)
+    if instance is None:
+        instance = queryset.filter(**{field: value}).first()
+        if instance is None:
+            instance = MISSING
+            cache.set(key, MISSING, settings.LOOKUP_MISS_TIMEOUT)
+        else:
+            cache.set(key, instance, settings.LOOKUP_CACHE_TIMEOUT)
+    if instance is MISSING:
+        raise Http404(f'{model._meta.object_name} {value!r} не найден')
+    return instance
+
+
+def get_group_or_404(slug):
+    return _get(Group.objects.all(), 'slug', slug)
+
+
+def get_author_or_404(username):
+    """
+    Пользователь без счётчиков (они меняются слишком часто) и только
+    с полями CACHED_USER_FIELDS
+    """
+    return _get(
+        User.objects.only(*CACHED_USER_FIELDS), 'username', username
+    )
+
+
+def forget(model, *values):
+    """Сбрасывает записи кэша для адресов values"""
+    cache.delete_many([lookup_key(model, value) for value in values])
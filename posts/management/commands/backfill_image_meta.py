@@ -0,0 +1,63 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts.cache import invalidate_cards
+from posts.images import failed_meta, read_meta
+from posts.models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def _read(name):
+    try:
+        with default_storage.open(name) as file:
+            return name, read_meta(file)
+    except Exception:
+        logger.exception('Не удалось прочитать картинку %s', name)
+        return name, None
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры, объём и заглушку картинок существующих '
+        'постов, в том числе загруженных import_archive'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать и уже заполненные картинки, в том числе '
+                 'не прочитанные в прошлые запуски'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            # Нечитаемые в прошлые запуски картинки отмечены image_size=0
+            posts = posts.filter(image_width__isnull=True).exclude(
+                image_size=0
+            )
+        names = posts.order_by().values_list('image', flat=True).distinct()
+        done = failed = 0
+        # Файлы читаются в пуле, в базу пишет только этот поток
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for name, meta in pool.map(_read, names.iterator()):
+                if meta is None:
+                    failed += 1
+                    meta = failed_meta()
+                else:
+                    done += 1
+                # update() не меняет updated_at, карточки сбрасываются ниже
+                Post.objects.filter(image=name).update(**meta)
+        if done:
+            invalidate_cards()
+        self.stdout.write(
+            f'Данные заполнены для {done} картинок, ошибок: {failed}'
+        )
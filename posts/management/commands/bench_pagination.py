@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+
+from posts.benchmarks import measure, scratch_database, seed_posts
+from posts.models import Post
+from posts.paginators import CursorPaginator
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время выборки первой и глубокой страницы ленты '
+        'для паджинации по номеру и по курсору'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        per_page = settings.POSTS_PER_PAGE
+        deep = options['page']
+        with scratch_database():
+            seed_posts(deep * per_page + per_page)
+            posts = Post.objects.all()
+
+            cursor_paginator = CursorPaginator(posts, per_page)
+            # Курсор глубокой страницы берём заранее, вне замера
+            anchor = posts.order_by('-pub_date', '-id')[
+                (deep - 1) * per_page - 1]
+            token = cursor_paginator.encode_cursor(anchor)
+
+            def offset_page(number):
+                return lambda: list(Paginator(posts, per_page).page(number))
+
+            def cursor_page(after):
+                return lambda: list(
+                    CursorPaginator(posts, per_page).get_page(after=after)
+                )
+
+            results = (
+                ('offset', 1, offset_page(1)),
+                ('offset', deep, offset_page(deep)),
+                ('cursor', 1, cursor_page(None)),
+                ('cursor', deep, cursor_page(token)),
+            )
+            for mode, number, func in results:
+                elapsed = measure(func, options['repeat'])
+                self.stdout.write(
+                    f'{mode:>6}  страница {number:>6}: {elapsed:8.2f} мс'
+                )
@@ -0,0 +1,70 @@
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+from posts import search
+from posts.benchmarks import measure, scratch_database, seed_posts
+from posts.models import Post
+
+SYLLABLES = (
+    'ба', 'ве', 'го', 'ду', 'же', 'зи', 'ко', 'ла', 'ми', 'но',
+    'пу', 'ре', 'са', 'ти', 'фо', 'ха', 'це', 'чу', 'ша', 'ям',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск по индексу FTS5 и поиск icontains '
+        'на синтетических постах'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--words', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            raise CommandError('Индекс FTS5 доступен только на SQLite')
+        rnd = random.Random(0)
+        # Частота слов убывает к концу словаря, как в живом тексте
+        vocabulary = [
+            ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+            for _ in range(options['words'])
+        ]
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+        def text(i):
+            return ' '.join(rnd.choices(vocabulary, weights, k=12))
+
+        per_page = settings.POSTS_PER_PAGE
+        with scratch_database():
+            seed_posts(options['posts'], text=text)
+            search.rebuild()
+            terms = (
+                ('частое', vocabulary[0]),
+                ('среднее', vocabulary[len(vocabulary) // 20]),
+                ('редкое', vocabulary[-1]),
+            )
+            for label, term in terms:
+                def icontains():
+                    posts = Post.objects.for_feed().filter(
+                        Q(text__icontains=term)
+                        | Q(group__title__icontains=term)
+                    )
+                    return list(Paginator(posts, per_page).page(1))
+
+                def fts():
+                    posts = search.find_posts(term)
+                    return list(Paginator(posts, per_page).page(1))
+
+                found = search.find_posts(term).count()
+                for mode, func in (('icontains', icontains), ('fts5', fts)):
+                    elapsed = measure(func, options['repeat'])
+                    self.stdout.write(
+                        f'{mode:>9}  {label:>8} ({found:>7} постов): '
+                        f'{elapsed:10.2f} мс'
+                    )
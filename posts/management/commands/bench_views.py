@@ -0,0 +1,338 @@
+import json
+import platform
+import subprocess
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, setup_test_environment, teardown_test_environment
+)
+from django.urls import reverse
+
+from posts.benchmarks import percentile, scratch_database, seed_site
+from posts.models import Follow, Group, Post
+
+# Допустимый рост p50 относительно прошлого прогона (доля)
+DEFAULT_THRESHOLD = 0.2
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер представлений на синтетических данных: '
+        'перцентили времени, число запросов и выделенная память. '
+        'Результаты пишутся в JSON и сравниваются с прошлым прогоном'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом'
+        )
+        parser.add_argument(
+            '--writers', type=int, default=0,
+            help='Потоков, одновременно создающих посты и комментарии'
+        )
+        parser.add_argument(
+            '--writes', type=int, default=50,
+            help='Запросов на запись от каждого потока'
+        )
+        parser.add_argument('--output', help='Файл для результатов (JSON)')
+        parser.add_argument(
+            '--compare', help='Результаты прошлого прогона для сравнения'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=DEFAULT_THRESHOLD,
+            help='Допустимый рост p50, доля (0.2 — на 20%%)'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        scale = {
+            name: options[name]
+            for name in ('users', 'groups', 'posts', 'comments', 'follows')
+        }
+        concurrency = None
+        setup_test_environment()
+        try:
+            # Потокам нужна общая база в файле, а не в памяти
+            with scratch_database(file_backed=options['writers'] > 0):
+                users = seed_site(seed=options['seed'], **scale)
+                results = self.run_views(users, options)
+                if options['writers']:
+                    concurrency = self.run_writers(users, options)
+        finally:
+            teardown_test_environment()
+
+        report = {
+            'revision': git_revision(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'scale': scale,
+            'requests': options['requests'],
+            'cold': options['cold'],
+            'views': results,
+            'concurrency': concurrency,
+        }
+        self.print_report(results, concurrency)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        if baseline is not None:
+            self.compare(baseline, report, options['threshold'])
+
+    def scenarios(self, users):
+        """Имя замера -> функция, выполняющая один запрос"""
+        viewer = Follow.objects.values_list('user', flat=True).first()
+        viewer = next(
+            (user for user in users if user.pk == viewer), users[0]
+        )
+        client = Client()
+        client.force_login(viewer)
+        guest = Client()
+        group = Group.objects.order_by('pk').first()
+        post = Post.objects.order_by('-comments_count').first()
+        author = post.author.username
+        counter = iter(range(10 ** 9))
+        return {
+            'index': lambda: guest.get(reverse('index')),
+            'index_page_100': lambda: guest.get(
+                reverse('index'), {'page': 100}
+            ),
+            # Следующая страница целиком и только её карточки
+            # (?fragment=1, «Показать ещё»)
+            'index_page_2': lambda: guest.get(reverse('index'), {'page': 2}),
+            'index_more_2': lambda: guest.get(
+                reverse('index'), {'page': 2, 'fragment': 1}
+            ),
+            'group_posts': lambda: guest.get(
+                reverse('group', kwargs={'slug': group.slug})
+            ),
+            'profile': lambda: client.get(
+                reverse('profile', kwargs={'username': author})
+            ),
+            'profile_page_2': lambda: client.get(
+                reverse('profile', kwargs={'username': author}),
+                {'page': 2}
+            ),
+            'profile_more_2': lambda: client.get(
+                reverse('profile', kwargs={'username': author}),
+                {'page': 2, 'fragment': 1}
+            ),
+            'post_view': lambda: client.get(reverse(
+                'post', kwargs={'username': author, 'post_id': post.id}
+            )),
+            'follow_index': lambda: client.get(reverse('follow_index')),
+            'popular': lambda: guest.get(reverse('popular')),
+            'group_trending': lambda: guest.get(
+                reverse('group_trending', kwargs={'slug': group.slug})
+            ),
+            'new_post': lambda: client.post(
+                reverse('new_post'),
+                {'text': f'Пост из замера {next(counter)}'}
+            ),
+            'add_comment': lambda: client.post(
+                reverse('add_comment', kwargs={
+                    'username': author, 'post_id': post.id
+                }),
+                {'text': f'Комментарий из замера {next(counter)}'}
+            ),
+        }
+
+    def run_views(self, users, options):
+        results = {}
+        for name, request in self.scenarios(users).items():
+            for _ in range(options['warmup']):
+                request()
+            timings, queries, sizes = [], [], []
+            for _ in range(options['requests']):
+                if options['cold']:
+                    cache.clear()
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = request()
+                    elapsed = time.perf_counter() - started
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{name}: ответ {response.status_code}'
+                    )
+                timings.append(elapsed * 1000)
+                queries.append(len(context))
+                sizes.append(len(response.content))
+            # Память отдельным проходом: трассировка замедляет запросы
+            memory = []
+            for _ in range(max(1, options['requests'] // 10)):
+                if options['cold']:
+                    cache.clear()
+                tracemalloc.start()
+                request()
+                memory.append(tracemalloc.get_traced_memory()[1] / 1024)
+                tracemalloc.stop()
+            timings.sort()
+            queries.sort()
+            sizes.sort()
+            memory.sort()
+            results[name] = {
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p90_ms': round(percentile(timings, 90), 3),
+                'p99_ms': round(percentile(timings, 99), 3),
+                'max_ms': round(timings[-1], 3),
+                'queries': percentile(queries, 50),
+                'max_queries': queries[-1],
+                'peak_kib': round(percentile(memory, 50), 1),
+                'bytes': percentile(sizes, 50),
+            }
+        return results
+
+    def run_writers(self, users, options):
+        """
+        Потоки одновременно создают посты и комментарии: пропускная
+        способность базы при конкурентной записи
+        """
+        post = Post.objects.order_by('-comments_count').first()
+        writers = users[:options['writers']]
+        barrier = threading.Barrier(len(writers))
+        timings, errors = [], []
+
+        def work(user):
+            client = Client()
+            client.force_login(user)
+            barrier.wait()
+            try:
+                for i in range(options['writes']):
+                    started = time.perf_counter()
+                    try:
+                        if i % 2:
+                            response = client.post(
+                                reverse('new_post'),
+                                {'text': f'Пост {user.pk}-{i}'}
+                            )
+                        else:
+                            response = client.post(
+                                reverse('add_comment', kwargs={
+                                    'username': post.author.username,
+                                    'post_id': post.id
+                                }),
+                                {'text': f'Комментарий {user.pk}-{i}'}
+                            )
+                        if response.status_code >= 400:
+                            errors.append(response.status_code)
+                    except Exception as error:
+                        # Например, database is locked у SQLite
+                        errors.append(repr(error))
+                    timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=work, args=(user,)) for user in writers
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        timings.sort()
+        return {
+            'writers': len(writers),
+            'requests': len(timings),
+            'errors': len(errors),
+            'throughput_rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p90_ms': round(percentile(timings, 90), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+        }
+
+    def print_report(self, results, concurrency=None):
+        self.stdout.write(
+            f'{"представление":<16}{"p50":>9}{"p90":>9}{"p99":>9}'
+            f'{"запросов":>10}{"КиБ":>9}{"байт":>9}'
+        )
+        for name, row in results.items():
+            self.stdout.write(
+                f'{name:<16}{row["p50_ms"]:>9.2f}{row["p90_ms"]:>9.2f}'
+                f'{row["p99_ms"]:>9.2f}{row["queries"]:>10}'
+                f'{row["peak_kib"]:>9.1f}{row["bytes"]:>9}'
+            )
+        if concurrency:
+            self.stdout.write(
+                f'\nЗапись из {concurrency["writers"]} потоков: '
+                f'{concurrency["throughput_rps"]} запросов/с, '
+                f'p50 {concurrency["p50_ms"]:.2f} мс, '
+                f'p99 {concurrency["p99_ms"]:.2f} мс, '
+                f'ошибок {concurrency["errors"]}'
+            )
+
+    def compare(self, baseline, report, threshold):
+        """
+        Сравнивает с прошлым прогоном; рост числа запросов или p50
+        больше порога считается регрессией
+        """
+        if baseline.get('scale') != report['scale']:
+            self.stderr.write(
+                'Масштаб данных отличается от прошлого прогона, '
+                'сравнение приблизительное'
+            )
+        regressions = []
+        self.stdout.write(
+            f'\nСравнение с {baseline.get("revision") or "прошлым прогоном"}'
+        )
+        for name, row in report['views'].items():
+            old = baseline.get('views', {}).get(name)
+            if old is None:
+                continue
+            change = row['p50_ms'] / old['p50_ms'] - 1 if old['p50_ms'] else 0
+            mark = ''
+            if row['queries'] > old['queries'] or change > threshold:
+                mark = '  РЕГРЕССИЯ'
+                regressions.append(name)
+            self.stdout.write(
+                f'{name:<16} p50 {old["p50_ms"]:.2f} -> {row["p50_ms"]:.2f}'
+                f' ({change:+.0%}), запросов {old["queries"]} -> '
+                f'{row["queries"]}{mark}'
+            )
+        old = baseline.get('concurrency')
+        new = report['concurrency']
+        if old and new and old['writers'] == new['writers']:
+            change = new['throughput_rps'] / old['throughput_rps'] - 1
+            mark = ''
+            if -change > threshold or new['errors'] > old['errors']:
+                mark = '  РЕГРЕССИЯ'
+                regressions.append('concurrency')
+            self.stdout.write(
+                f'{"запись":<16} {old["throughput_rps"]} -> '
+                f'{new["throughput_rps"]} запросов/с ({change:+.0%}), '
+                f'ошибок {old["errors"]} -> {new["errors"]}{mark}'
+            )
+        if regressions:
+            raise CommandError('Регрессии: ' + ', '.join(regressions))
@@ -0,0 +1,60 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from posts.export import FORMATS, KINDS, export_queryset, iter_export
+
+
+def moment(value):
+    """Дата или дата со временем из ISO 8601"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Некорректная дата: {value!r}')
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково выгружает посты или комментарии в CSV или JSONL '
+        'в формате import_archive'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(KINDS))
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument(
+            '--output', help='Файл выгрузки, по умолчанию stdout'
+        )
+        parser.add_argument('--group', help='slug сообщества')
+        parser.add_argument('--author', help='username автора')
+        parser.add_argument('--since', type=moment, help='Не раньше даты')
+        parser.add_argument('--until', type=moment, help='Раньше даты')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        queryset = export_queryset(
+            options['kind'],
+            group=options['group'],
+            author=options['author'],
+            since=options['since'],
+            until=options['until'],
+        )
+        lines = iter_export(
+            options['kind'], options['format'], queryset,
+            chunk_size=options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8',
+                      newline='') as f:
+                f.writelines(lines)
+        else:
+            # Строки уже заканчиваются переводом строки
+            for line in lines:
+                self.stdout.write(line, ending='')
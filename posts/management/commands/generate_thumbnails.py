@@ -0,0 +1,47 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import mark_failed, refresh
+
+logger = logging.getLogger(__name__)
+
+
+def _generate(name):
+    try:
+        refresh(name)
+        return True
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        mark_failed(name)
+        return False
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры картинок существующих постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS
+        )
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).order_by().values_list('image', flat=True).distinct()
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for ok in pool.map(_generate, names.iterator()):
+                if ok:
+                    done += 1
+                else:
+                    failed += 1
+        self.stdout.write(
+            f'Миниатюры созданы для {done} картинок, ошибок: {failed}'
+        )
@@ -0,0 +1,74 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.archive import KINDS, ArchiveError, ArchiveImporter, Checkpoint
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает сообщества, посты, комментарии и подписки из файлов '
+        'JSONL или CSV пачками bulk_create. Прерванная загрузка '
+        'продолжается с контрольной точки'
+    )
+
+    def add_arguments(self, parser):
+        for kind in KINDS:
+            parser.add_argument(
+                f'--{kind}', action='append', default=[], metavar='FILE',
+                help='Файл .jsonl или .csv, можно указать несколько раз'
+            )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--checkpoint', default='import_archive.checkpoint.json',
+            help='Файл контрольной точки; удаляется после загрузки'
+        )
+        parser.add_argument(
+            '--full-rebuild', action='store_true',
+            help='Пересчитать счётчики, индекс поиска, рейтинги и ленты '
+                 'всего сайта, а не только затронутых загрузкой '
+                 'пользователей и постов'
+        )
+        parser.add_argument(
+            '--skip-thumbnails', action='store_true',
+            help='Не создавать миниатюры картинок после загрузки'
+        )
+        parser.add_argument(
+            '--skip-image-meta', action='store_true',
+            help='Не заполнять размеры и заглушки картинок после загрузки '
+                 '(их заполнит backfill_image_meta)'
+        )
+
+    def report(self, kind, path, count, imported, elapsed):
+        if self.verbosity > 0:
+            self.stdout.write(
+                f'{kind}: {path}: {count} записей, '
+                f'{imported / elapsed:.0f} в секунду'
+            )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        checkpoint = Checkpoint(options['checkpoint'])
+        importer = ArchiveImporter(
+            batch_size=options['batch_size'],
+            checkpoint=checkpoint,
+            report=self.report
+        )
+        for kind in KINDS:
+            for path in options[kind]:
+                try:
+                    imported = importer.import_file(kind, path)
+                except ArchiveError as error:
+                    raise CommandError(
+                        f'{error}. Загрузка продолжится с последней '
+                        f'записанной пачки при повторном запуске'
+                    )
+                self.stdout.write(f'{kind}: {path}: загружено {imported}')
+        self.stdout.write('Пересчёт счётчиков, индекса поиска и лент...')
+        importer.finish(full=options['full_rebuild'])
+        if not options['skip_image_meta']:
+            # Картинки загружаются без размеров и заглушек (posts.images)
+            call_command('backfill_image_meta', stdout=self.stdout)
+        if not options['skip_thumbnails']:
+            call_command('generate_thumbnails', stdout=self.stdout)
+        checkpoint.clear()
+        self.stdout.write('Загрузка завершена')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = 'Заново собирает материализованные ленты подписок'
+
+    def handle(self, *args, **options):
+        if not timeline.timeline_enabled():
+            raise CommandError(
+                'Материализованная лента выключена: '
+                'FOLLOW_TIMELINE_ENABLED = False'
+            )
+        with transaction.atomic():
+            timeline.rebuild()
+        self.stdout.write('Ленты подписок пересобраны')
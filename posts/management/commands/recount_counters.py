@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import recount_comments, recount_user_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики постов, комментариев '
+        'и подписок и исправляет расхождения'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = recount_user_stats()
+            posts = recount_comments()
+        self.stdout.write(
+            f'Исправлено счётчиков пользователей: {users}, '
+            f'постов: {posts}'
+        )
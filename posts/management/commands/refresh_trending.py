@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+from posts.cache import invalidate_scopes
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинги лент «Популярное» и «Обсуждаемое» '
+        'и убирает посты без недавней активности'
+    )
+
+    def handle(self, *args, **options):
+        count = trending.refresh()
+        invalidate_scopes('trending')
+        self.stdout.write(f'Рейтинги пересчитаны: {count} постов')
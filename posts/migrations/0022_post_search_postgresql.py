@@ -0,0 +1,45 @@
+from django.db import migrations
+
+CREATE_TABLE = (
+    'CREATE TABLE IF NOT EXISTS posts_post_search ('
+    'post_id integer PRIMARY KEY '
+    'REFERENCES posts_post (id) ON DELETE CASCADE, '
+    'document tsvector NOT NULL)'
+)
+CREATE_INDEX = (
+    'CREATE INDEX IF NOT EXISTS posts_post_search_document_idx '
+    'ON posts_post_search USING GIN (document)'
+)
+FILL_INDEX = (
+    "INSERT INTO posts_post_search (post_id, document) "
+    "SELECT p.id, "
+    "setweight(to_tsvector('russian', p.text), 'A') || "
+    "setweight(to_tsvector('russian', COALESCE(g.title, '')), 'B') "
+    "FROM posts_post p LEFT JOIN posts_group g ON g.id = p.group_id"
+)
+
+
+def create_search_index(apps, schema_editor):
+    # Индекс tsvector для PostgreSQL; SQLite ищет по FTS5 (0018)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_TABLE)
+    schema_editor.execute(CREATE_INDEX)
+    schema_editor.execute(FILL_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_post_image_meta'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,9 +1,23 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 
 USER = get_user_model()
 
 
+class CountedModel(models.Model):
+    """
+    Модель, от записей которой зависят счётчики: сохранение и
+    обновление счётчиков в posts.signals идут в одной транзакции
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
 class Group(models.Model):
     """Класс, описивающий структуру сообщества"""
     title = models.CharField(
@@ -31,7 +45,16 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """
+        Посты для карточек post_item.html: авторы и сообщества
+        загружаются одним запросом с постами
+        """
+        return self.select_related('author', 'group')
+
+
+class Post(CountedModel):
     """Класс, описивающий структуру поста"""
     text = models.TextField(
         verbose_name='Текст',
@@ -42,6 +65,11 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    # Версия карточки поста в кэше (posts.cards)
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
     author = models.ForeignKey(
         USER,
         on_delete=models.CASCADE,
@@ -57,17 +85,62 @@ class Post(models.Model):
     image = models.ImageField(
         upload_to='posts/',
         blank=True, null=True)
+    # Считаются при сохранении PostForm (posts.images), чтобы шаблоны
+    # не открывали файл картинки
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        blank=True, null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        blank=True, null=True,
+        editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        'Размер картинки в байтах',
+        blank=True, null=True,
+        editable=False
+    )
+    image_placeholder = models.TextField(
+        'Заглушка картинки (data: URI)',
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ['-pub_date']
+        indexes = [
+            # Ключ курсорной паджинации лент
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_id_idx'
+            ),
+            # Ленты профиля и сообщества
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Comment(models.Model):
+class Comment(CountedModel):
     """Класс, описивающий структуру комментария"""
     author = models.ForeignKey(
         USER,
@@ -95,12 +168,18 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='comment_post_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Follow(models.Model):
+class Follow(CountedModel):
     author = models.ForeignKey(
         USER,
         on_delete=models.CASCADE,
@@ -111,3 +190,127 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='follower',
     )
+
+    class Meta:
+        constraints = [
+            # Уникальный индекс заодно обслуживает поиск пары
+            # в profile и profile_follow
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='follow_unique_user_author'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, обновляемые при записи постов и подписок"""
+    user = models.OneToOneField(
+        USER,
+        on_delete=models.CASCADE,
+        related_name='stats',
+        primary_key=True
+    )
+    posts_count = models.PositiveIntegerField('Записей', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
+
+    @classmethod
+    def for_user(cls, user):
+        """Счётчики пользователя; отсутствующие пересчитываются"""
+        try:
+            return user.stats
+        except cls.DoesNotExist:
+            from .counters import recount_user_stats
+            recount_user_stats(USER.objects.filter(pk=user.pk))
+            return cls.objects.get(user=user)
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя"""
+    user = models.ForeignKey(
+        USER,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        USER,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    # Копия Post.pub_date: лента читается одним проходом по индексу
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи лент подписок'
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='timeline_unique_user_post'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class PostScore(models.Model):
+    """
+    Рейтинг поста для лент «Популярное» и «Обсуждаемое»
+    (posts.trending): чем больше свежих комментариев и чем новее пост,
+    тем выше score
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='trending',
+        primary_key=True
+    )
+    # Копия Post.group: лента сообщества читается по индексу
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        blank=True, null=True
+    )
+    score = models.FloatField()
+    last_activity = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Рейтинг поста'
+        verbose_name_plural = 'Рейтинги постов'
+        indexes = [
+            models.Index(
+                fields=['-score', '-post'],
+                name='postscore_score_idx'
+            ),
+            models.Index(
+                fields=['group', '-score', '-post'],
+                name='postscore_group_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.post_id)
@@ -0,0 +1,259 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import (
+    EmptyPage, Page, PageNotAnInteger, Paginator
+)
+from django.db.models import Q
+
+# Комментарии на странице поста и в API: в порядке написания, «Показать
+# ещё» подгружает более новые
+COMMENTS_ORDERING = ('created', 'id')
+
+
+class CursorPage(Page):
+    """Страница ленты, полученная по курсору, а не по номеру"""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<CursorPage of %s>' % len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        """Токен для ?after=, указывающий на последний пост страницы"""
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        """Токен для ?before=, указывающий на первый пост страницы"""
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0])
+
+
+class CursorPaginator(Paginator):
+    """
+    Паджинатор по ключу сортировки (keyset).
+    Не выполняет COUNT(*) и OFFSET, поэтому любая страница
+    выбирается за одно и то же время.
+    """
+
+    default_ordering = ('-pub_date', '-id')
+
+    def __init__(self, object_list, per_page, ordering=None):
+        super().__init__(object_list, per_page)
+        # Явная сортировка queryset (order_by) используется как ключ
+        self.ordering = tuple(
+            ordering or object_list.query.order_by or self.default_ordering
+        )
+
+    @property
+    def page_range(self):
+        # Общее число страниц неизвестно и не вычисляется
+        return range(0)
+
+    def get_page(self, after=None, before=None):
+        """
+        Возвращает страницу после курсора after или перед курсором before.
+        Отсутствующий или повреждённый курсор даёт первую страницу.
+        """
+        if before:
+            values = self.decode_cursor(before)
+            if values is not None:
+                rows = self._fetch(values, reverse=True)
+                has_more = len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+                return CursorPage(rows, self, True, has_more)
+        if after:
+            values = self.decode_cursor(after)
+            if values is not None:
+                rows = self._fetch(values)
+                has_more = len(rows) > self.per_page
+                return CursorPage(rows[:self.per_page], self, has_more, True)
+        rows = self._fetch(None)
+        has_more = len(rows) > self.per_page
+        return CursorPage(rows[:self.per_page], self, has_more, False)
+
+    def _fetch(self, values, reverse=False):
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self._flip(field) for field in ordering)
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(self._seek(ordering, values))
+        return list(queryset.order_by(*ordering)[:self.per_page + 1])
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    def _seek(self, ordering, values):
+        """Условие «строго после курсора» для заданной сортировки"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            operator = 'lt' if field.startswith('-') else 'gt'
+            lookup = '%s__%s' % (name, operator)
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        # Нестрогая граница по первому полю позволяет базе
+        # начать чтение индекса сразу с позиции курсора
+        first = ordering[0]
+        bound = '%s__%s' % (
+            first.lstrip('-'), 'lte' if first.startswith('-') else 'gte'
+        )
+        return Q(**{bound: values[0]}) & condition
+
+    def _fields(self):
+        """Пары (атрибут, поле) ключа: поля модели или аннотации"""
+        query = self.object_list.query
+        opts = self.object_list.model._meta
+        fields = []
+        for name in self.ordering:
+            name = name.lstrip('-')
+            if name in query.annotations:
+                fields.append((name, query.annotations[name].output_field))
+            else:
+                field = opts.get_field(name)
+                fields.append((field.attname, field))
+        return fields
+
+    def encode_cursor(self, obj):
+        """Кодирует ключ сортировки объекта в непрозрачный токен"""
+        values = []
+        for attname, _ in self._fields():
+            value = getattr(obj, attname)
+            # isoformat() сохраняет микросекунды, важные для сравнения
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        raw = json.dumps(values).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        """Декодирует токен; для некорректного токена возвращает None"""
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            values = json.loads(raw.decode())
+            fields = self._fields()
+            if not isinstance(values, list) or len(values) != len(fields):
+                return None
+            values = [
+                field.to_python(value)
+                for (_, field), value in zip(fields, values)
+            ]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+        if any(value is None for value in values):
+            return None
+        return values
+
+
+class FeedPaginator(Paginator):
+    """
+    Паджинатор лент по номерам страниц.
+
+    Общее число постов передаётся в count числом или функцией
+    (posts.feed_counts, счётчик UserStats) и может быть приблизительным:
+    страница выбирается с одним лишним постом, так что её посты и
+    наличие следующей страницы точны, а от count зависят только номера
+    страниц в навигации. На последней странице число становится точным.
+    Номера выводятся окном (elided_page_range страницы): первая,
+    последняя и соседние с текущей страницы.
+    """
+    ELLIPSIS = '…'
+    on_each_side = 2
+    on_ends = 1
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = super().count
+        elif callable(self._count):
+            self._count = self._count()
+        return self._count
+
+    def _set_count(self, count):
+        self._count = count
+        self.__dict__.pop('num_pages', None)
+
+    def validate_number(self, number):
+        # Верхняя граница проверяется по самой выборке в page()
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            # Лента кончается раньше, чем считалось: номер последней
+            # страницы нужен точно
+            self._set_count(None)
+            raise EmptyPage('На странице нет постов')
+        if len(rows) > self.per_page:
+            self._set_count(max(self.count, bottom + len(rows)))
+        else:
+            self._set_count(bottom + len(rows))
+        page = self._get_page(rows[:self.per_page], number, self)
+        page.elided_page_range = list(self.get_elided_page_range(number))
+        return page
+
+    def get_page(self, number):
+        try:
+            number = self.validate_number(number)
+        except PageNotAnInteger:
+            number = 1
+        except EmptyPage:
+            number = 1
+        try:
+            return self.page(number)
+        except EmptyPage:
+            return self.page(max(self.num_pages, 1))
+
+    def get_elided_page_range(self, number):
+        """Номера страниц вокруг number с многоточиями на месте пропусков"""
+        on_each_side, on_ends = self.on_each_side, self.on_ends
+        last = self.num_pages
+        if last <= (on_each_side + on_ends) * 2:
+            yield from range(1, last + 1)
+            return
+        if number > on_each_side + on_ends + 2:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < last - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(last - on_ends + 1, last + 1)
+        else:
+            yield from range(number + 1, last + 1)
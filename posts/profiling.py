@@ -0,0 +1,246 @@
+"""
+Профилирование выборки запросов.
+
+ProfilingMiddleware с вероятностью PROFILING_SAMPLE_RATE включает для
+запроса RequestProfile: число и время SQL-запросов, время отрисовки
+каждого шаблона (включая вложенные include), время контекстных
+процессоров, миниатюр и попадания в кэши. Итог уходит в лог
+posts.profiling и в кольцевой буфер, который показывает страница
+админки «Профилирование». Заголовок Server-Timing раскрывает запросы
+и шаблоны, поэтому получают его только сотрудники (is_staff) или все
+при PROFILING_SERVER_TIMING.
+
+При PROFILING_SAMPLE_RATE = 0 промежуточный слой отключается целиком
+(MiddlewareNotUsed) и ничего не подменяет. Для запросов вне выборки
+остаётся одна проверка thread-local.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+from django.template.context import RequestContext
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_installed = False
+_install_lock = threading.Lock()
+
+samples = deque(maxlen=settings.PROFILING_BUFFER_SIZE)
+
+
+def current():
+    """Профиль текущего запроса или None, если запрос не в выборке"""
+    return getattr(_local, 'profile', None)
+
+
+class RequestProfile:
+    def __init__(self, request):
+        self.method = request.method
+        self.path = request.get_full_path()
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        # имя -> [количество, секунды]
+        self.templates = {}
+        self.sections = {}
+        # имя кэша -> [попадания, промахи]
+        self.cache = {}
+        self._depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка execute_wrapper: считает запросы и их время"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - started
+
+    @staticmethod
+    def _add(table, name, elapsed):
+        entry = table.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    @contextmanager
+    def template(self, name):
+        started = time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            elapsed = time.perf_counter() - started
+            self._add(self.templates, name, elapsed)
+            if not self._depth:
+                self.render_time += elapsed
+
+    def add_section(self, name, elapsed):
+        self._add(self.sections, name, elapsed)
+
+    def record_cache(self, name, hit):
+        entry = self.cache.setdefault(name, [0, 0])
+        entry[0 if hit else 1] += 1
+
+    def server_timing(self, total):
+        """Значение заголовка Server-Timing"""
+        metrics = [
+            'db;dur=%.1f;desc="%d queries"' % (
+                self.sql_time * 1000, self.queries
+            ),
+            'tpl;dur=%.1f' % (self.render_time * 1000),
+        ]
+        for name, (_, elapsed) in sorted(self.sections.items()):
+            metrics.append('%s;dur=%.1f' % (name, elapsed * 1000))
+        for name, (hits, misses) in sorted(self.cache.items()):
+            metrics.append('cache-%s;desc="hit %d, miss %d"' % (
+                name, hits, misses
+            ))
+        metrics.append('total;dur=%.1f' % (total * 1000))
+        return ', '.join(metrics)
+
+    def as_dict(self, status, total):
+        def millis(table):
+            # Самые долгие первыми
+            rows = sorted(table.items(), key=lambda row: -row[1][1])
+            return {
+                name: {'count': count, 'ms': round(elapsed * 1000, 2)}
+                for name, (count, elapsed) in rows
+            }
+        return {
+            'time': timezone.now().isoformat(timespec='seconds'),
+            'method': self.method,
+            'path': self.path,
+            'status': status,
+            'total_ms': round(total * 1000, 2),
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'render_ms': round(self.render_time * 1000, 2),
+            'templates': millis(self.templates),
+            'sections': millis(self.sections),
+            'cache': {
+                name: {'hits': hits, 'misses': misses}
+                for name, (hits, misses) in self.cache.items()
+            },
+        }
+
+
+@contextmanager
+def section(name):
+    """Замеряет участок кода, если запрос профилируется"""
+    profile = current()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_section(name, time.perf_counter() - started)
+
+
+def record_cache(name, hit):
+    """Отмечает попадание или промах кэша name"""
+    profile = current()
+    if profile is not None:
+        profile.record_cache(name, hit)
+
+
+_render = Template.render
+_bind_template = RequestContext.bind_template
+
+
+def _profiled_render(self, context):
+    profile = current()
+    if profile is None:
+        return _render(self, context)
+    with profile.template(self.name or '<строка>'):
+        return _render(self, context)
+
+
+@contextmanager
+def _profiled_bind_template(self, template):
+    profile = current()
+    if profile is None:
+        with _bind_template(self, template):
+            yield
+        return
+    started = time.perf_counter()
+    with _bind_template(self, template):
+        profile.add_section(
+            'context_processors', time.perf_counter() - started
+        )
+        yield
+
+
+def install():
+    """Подключает замеры шаблонов и контекстных процессоров"""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        Template.render = _profiled_render
+        RequestContext.bind_template = _profiled_bind_template
+        _installed = True
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if samples.maxlen != settings.PROFILING_BUFFER_SIZE:
+            resize(settings.PROFILING_BUFFER_SIZE)
+        install()
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = RequestProfile(request)
+        _local.profile = profile
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        total = time.perf_counter() - profile.started
+        if settings.PROFILING_SERVER_TIMING or is_staff(request):
+            response['Server-Timing'] = profile.server_timing(total)
+        sample = profile.as_dict(response.status_code, total)
+        samples.append(sample)
+        logger.info(
+            '%s %s: %s мс, SQL %s (%s мс), шаблоны %s мс',
+            sample['method'], sample['path'], sample['total_ms'],
+            sample['queries'], sample['sql_ms'], sample['render_ms']
+        )
+        return response
+
+
+def resize(size):
+    """Меняет размер кольцевого буфера, сохраняя последние записи"""
+    global samples
+    samples = deque(samples, maxlen=size)
+
+
+def recent():
+    """Последние записи буфера, новые первыми"""
+    return list(reversed(samples))
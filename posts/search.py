@@ -0,0 +1,306 @@
+"""
+Полнотекстовый поиск по постам.
+
+На SQLite тексты постов и названия их сообществ хранятся в виртуальной
+таблице FTS5 (обратный индекс), на PostgreSQL — в таблице
+posts_post_search со столбцом tsvector под индексом GIN. Индекс
+обновляется сигналами моделей в posts.signals, результаты упорядочены
+по релевантности (bm25 и ts_rank). На остальных базах поиск сводится
+к icontains, о чём find_posts один раз предупреждает в журнале.
+"""
+import logging
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .bulk import batches
+from .models import Group, Post
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'posts_post_fts'
+PG_TABLE = 'posts_post_search'
+PG_CONFIG = 'russian'
+# Веса столбцов для bm25: совпадение в тексте важнее, чем в сообществе
+TEXT_WEIGHT = 1.0
+GROUP_WEIGHT = 0.5
+MAX_TERMS = 10
+BATCH_SIZE = 500
+
+WORD_RE = re.compile(r'\w+')
+# Для to_tsquery: подчёркивание парсер tsquery считает разделителем
+PG_WORD_RE = re.compile(r'[^\W_]+')
+
+# Документ поста для PostgreSQL: текст (вес A) и название сообщества (B)
+PG_DOCUMENT = (
+    "setweight(to_tsvector('{config}', p.text), 'A') || "
+    "setweight(to_tsvector('{config}', COALESCE(g.title, '')), 'B')"
+).format(config=PG_CONFIG)
+PG_SOURCE = (
+    'FROM {posts} p LEFT JOIN {groups} g ON g.id = p.group_id'
+).format(posts=Post._meta.db_table, groups=Group._meta.db_table)
+
+_warned = False
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def tsvector_enabled():
+    return connection.vendor == 'postgresql'
+
+
+def index_enabled():
+    """Есть ли у базы полнотекстовый индекс постов"""
+    return fts_enabled() or tsvector_enabled()
+
+
+def match_expression(query):
+    """
+    Выражение MATCH из строки пользователя: каждое слово ищется
+    как префикс, слова объединяются через AND. Синтаксис FTS5
+    (кавычки, операторы) в запросе не интерпретируется
+    """
+    words = WORD_RE.findall(query.lower())[:MAX_TERMS]
+    return ' '.join('"%s"*' % word for word in words)
+
+
+def ts_query(query):
+    """То же для to_tsquery PostgreSQL: префиксы слов через &"""
+    words = PG_WORD_RE.findall(query.lower())[:MAX_TERMS]
+    return ' & '.join('%s:*' % word for word in words)
+
+
+def has_terms(query):
+    """Есть ли в запросе слова для поиска по индексу"""
+    if tsvector_enabled():
+        return bool(ts_query(query))
+    return bool(match_expression(query))
+
+
+class SearchResults:
+    """
+    Найденные посты в порядке релевантности. Поддерживает count()
+    и срезы, поэтому передаётся в Paginator как queryset
+    """
+
+    def __init__(self, match):
+        self.match = match
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT COUNT(*) FROM %s WHERE %s MATCH %%s'
+                    % (TABLE, TABLE),
+                    [self.match]
+                )
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        limit = -1 if key.stop is None else max(key.stop - start, 0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM {table} WHERE {table} MATCH %s '
+                'ORDER BY bm25({table}, %s, %s), rowid DESC '
+                'LIMIT %s OFFSET %s'.format(table=TABLE),
+                [self.match, TEXT_WEIGHT, GROUP_WEIGHT, limit, start]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = Post.objects.for_feed().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def _warn_unindexed():
+    global _warned
+    if not _warned:
+        _warned = True
+        logger.warning(
+            'Для базы %s нет полнотекстового индекса постов, поиск '
+            'идёт перебором таблицы (icontains)', connection.vendor
+        )
+
+
+def find_posts(query):
+    """Посты, подходящие под поисковый запрос, лучшие первыми"""
+    if not index_enabled():
+        _warn_unindexed()
+        return Post.objects.for_feed().filter(
+            Q(text__icontains=query) | Q(group__title__icontains=query)
+        )
+    if not has_terms(query):
+        return Post.objects.none()
+    if tsvector_enabled():
+        rank = RawSQL(
+            'SELECT ts_rank(s.document, to_tsquery(%s, %s)) '
+            'FROM {table} s WHERE s.post_id = {posts}.id'.format(
+                table=PG_TABLE, posts=Post._meta.db_table
+            ),
+            [PG_CONFIG, ts_query(query)],
+            output_field=FloatField()
+        )
+        return Post.objects.for_feed().filter(
+            pk__in=matching_ids(query)
+        ).annotate(search_rank=rank).order_by(
+            F('search_rank').desc(), '-id'
+        )
+    return SearchResults(match_expression(query))
+
+
+def matching_ids(query):
+    """Подзапрос id постов для фильтра pk__in (например, в админке)"""
+    if tsvector_enabled():
+        return RawSQL(
+            'SELECT post_id FROM %s WHERE document @@ to_tsquery(%%s, %%s)'
+            % PG_TABLE,
+            [PG_CONFIG, ts_query(query)]
+        )
+    return RawSQL(
+        'SELECT rowid FROM %s WHERE %s MATCH %%s' % (TABLE, TABLE),
+        [match_expression(query)]
+    )
+
+
+def index_post(post):
+    """
+    Добавляет пост в индекс или обновляет его запись. Название
+    сообщества берётся подзапросом по post.group_id, без загрузки
+    post.group
+    """
+    if tsvector_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {table} (post_id, document) '
+                'SELECT p.id, {document} {source} WHERE p.id = %s '
+                'ON CONFLICT (post_id) DO UPDATE '
+                'SET document = EXCLUDED.document'.format(
+                    table=PG_TABLE, document=PG_DOCUMENT, source=PG_SOURCE
+                ),
+                [post.pk]
+            )
+        return
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % TABLE, [post.pk])
+        cursor.execute(
+            'INSERT INTO {table} (rowid, text, group_title) '
+            'VALUES (%s, %s, COALESCE('
+            '(SELECT title FROM {groups} WHERE id = %s), \'\'))'.format(
+                table=TABLE, groups=Group._meta.db_table
+            ),
+            [post.pk, post.text, post.group_id]
+        )
+
+
+def remove_post(post_id):
+    if tsvector_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM %s WHERE post_id = %%s' % PG_TABLE, [post_id]
+            )
+        return
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % TABLE, [post_id])
+
+
+def index_group(group, title=None):
+    """
+    Обновляет название сообщества у его постов; title='' — при
+    удалении сообщества, пока посты ещё ссылаются на него
+    """
+    title = group.title if title is None else title
+    if tsvector_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE {table} s SET document = "
+                "setweight(to_tsvector('{config}', p.text), 'A') || "
+                "setweight(to_tsvector('{config}', %s), 'B') "
+                "FROM {posts} p WHERE p.id = s.post_id "
+                "AND p.group_id = %s".format(
+                    table=PG_TABLE, config=PG_CONFIG,
+                    posts=Post._meta.db_table
+                ),
+                [title, group.pk]
+            )
+        return
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE {table} SET group_title = %s WHERE rowid IN '
+            '(SELECT id FROM {posts} WHERE group_id = %s)'.format(
+                table=TABLE, posts=Post._meta.db_table
+            ),
+            [title, group.pk]
+        )
+
+
+def rebuild(posts=None):
+    """
+    Заново строит индекс по всем постам или только по постам posts
+    (после массовой загрузки)
+    """
+    if posts is None:
+        _rebuild_rows('', [])
+        return
+    ids = posts.order_by().values_list('pk', flat=True)
+    for batch in batches(ids.iterator(chunk_size=BATCH_SIZE), BATCH_SIZE):
+        _rebuild_rows(
+            'IN (%s)' % ', '.join(['%s'] * len(batch)), batch
+        )
+
+
+def _rebuild_rows(condition, params):
+    """Строит индекс постов с id, подходящим под condition"""
+    if tsvector_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM %s%s' % (
+                    PG_TABLE, condition and ' WHERE post_id ' + condition
+                ),
+                params
+            )
+            cursor.execute(
+                'INSERT INTO {table} (post_id, document) '
+                'SELECT p.id, {document} {source}{where}'.format(
+                    table=PG_TABLE, document=PG_DOCUMENT, source=PG_SOURCE,
+                    where=condition and ' WHERE p.id ' + condition
+                ),
+                params
+            )
+        return
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM %s%s' % (
+                TABLE, condition and ' WHERE rowid ' + condition
+            ),
+            params
+        )
+        cursor.execute(
+            'INSERT INTO {table} (rowid, text, group_title) '
+            'SELECT p.id, p.text, COALESCE(g.title, \'\') '
+            'FROM {posts} p LEFT JOIN {groups} g ON g.id = p.group_id'
+            '{where}'.format(
+                table=TABLE,
+                posts=Post._meta.db_table,
+                groups=Group._meta.db_table,
+                where=condition and ' WHERE p.id ' + condition,
+            ),
+            params
+        )
@@ -0,0 +1,242 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from . import lookups, search, timeline, trending
+from .cache import (
+    invalidate_cards, invalidate_feeds, invalidate_scopes, post_scopes
+)
+from .counters import change_comments_count, change_user_stats
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+# Загруженные значения полей (post_init), с которыми сигналы сравнивают
+# сохранённые: имена в карточках постов и сообщество поста
+LOADED_FIELDS = {
+    Group: ('slug', 'title'), User: ('username',), Post: ('group_id',)
+}
+LOOKUP_FIELDS = {Group: 'slug', User: 'username'}
+
+
+def _loaded_values(sender, instance):
+    # Через __dict__: отложенное поле (only()) не загружается запросом
+    return {
+        field: instance.__dict__.get(field)
+        for field in LOADED_FIELDS[sender]
+    }
+
+
+@receiver(post_init, sender=Group)
+@receiver(post_init, sender=User)
+@receiver(post_init, sender=Post)
+def remember_loaded_values(sender, instance, **kwargs):
+    """Загруженные значения полей, чтобы после сохранения найти изменения"""
+    instance._loaded = _loaded_values(sender, instance)
+
+
+def _only_login(update_fields):
+    return update_fields is not None and set(update_fields) == {'last_login'}
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_scopes(sender, instance, **kwargs):
+    """
+    Пост виден в общей ленте, профиле автора, сообществе и на своей
+    странице; при переносе — и в прежнем сообществе
+    """
+    invalidate_scopes(*post_scopes(
+        instance, group_ids=(instance._loaded['group_id'],)
+    ))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_scopes(sender, instance, **kwargs):
+    """Число комментариев поста есть в его карточке во всех лентах"""
+    if Comment.post.is_cached(instance):
+        invalidate_scopes(*post_scopes(instance.post))
+        return
+    post = Post.objects.filter(pk=instance.post_id).only(
+        'author_id', 'group_id'
+    ).first()
+    if post is None:
+        # Пост удаляется вместе с комментариями и сбросит всё сам
+        invalidate_scopes(f'post:{instance.post_id}')
+    else:
+        invalidate_scopes(*post_scopes(post))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_scopes(sender, instance, **kwargs):
+    """Счётчики подписок в профилях обоих и лента подписок читателя"""
+    invalidate_scopes(
+        f'author:{instance.author_id}',
+        f'author:{instance.user_id}',
+        f'follower:{instance.user_id}',
+    )
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_scope(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_scopes(f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_scope(sender, instance, created, update_fields=None,
+                            **kwargs):
+    """Имя и счётчики автора в профиле; вход в систему их не меняет"""
+    if not created and not _only_login(update_fields):
+        invalidate_scopes(f'author:{instance.pk}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=User)
+def invalidate_card_cache(sender, instance, created, **kwargs):
+    """
+    Название сообщества и имя автора есть в карточках постов во всех
+    лентах, но не меняют updated_at поста. Версии карточек и всех
+    лент меняются, только если эти поля изменились
+    """
+    if not created and _loaded_values(sender, instance) != instance._loaded:
+        invalidate_cards()
+        invalidate_feeds()
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_cards_of_group(sender, **kwargs):
+    """Карточки постов удалённого сообщества теряют ссылку на него"""
+    invalidate_cards()
+    invalidate_feeds()
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        change_user_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    """Раскладывает новый пост (в том числе из new_post) по лентам"""
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def rank_post(sender, instance, created, **kwargs):
+    if created:
+        trending.add_post(instance)
+    else:
+        trending.move_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def rank_commented_post(sender, instance, created, **kwargs):
+    """Комментарий (add_comment) поднимает пост в «Популярном»"""
+    if created:
+        trending.add_comment(instance)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_user_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        change_user_stats(instance.author_id, followers_count=1)
+        change_user_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change_user_stats(instance.author_id, followers_count=-1)
+    change_user_stats(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """Подписка (profile_follow) добавляет посты автора в ленту"""
+    if created:
+        timeline.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    """Отписка (profile_unfollow) убирает посты автора из ленты"""
+    timeline.trim(instance.user_id, instance.author_id)
+    timeline.followers_changed(instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_index(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def index_group(sender, instance, created, **kwargs):
+    if not created:
+        search.index_group(instance)
+
+
+@receiver(pre_delete, sender=Group)
+def remove_group_from_index(sender, instance, **kwargs):
+    """Посты удаляемого сообщества остаются, но без его названия"""
+    search.index_group(instance, title='')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_lookup(sender, instance, update_fields=None, **kwargs):
+    """Сбрасывает кэш и под новым, и под прежним slug или именем"""
+    if _only_login(update_fields):
+        return
+    field = LOOKUP_FIELDS[sender]
+    values = {getattr(instance, field)}
+    previous = instance._loaded[field]
+    if previous:
+        values.add(previous)
+    lookups.forget(sender, *values)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Post)
+def remember_saved_values(sender, instance, **kwargs):
+    """
+    Сохранённые значения становятся исходными для следующего
+    сохранения. Приёмник объявлен последним, после всех сравнений
+    """
+    instance._loaded = _loaded_values(sender, instance)
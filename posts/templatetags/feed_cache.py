@@ -0,0 +1,41 @@
+from django import template
+
+from posts.cache import get_fragment, set_fragment
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, key):
+        self.nodelist = nodelist
+        self.key = key
+
+    def render(self, context):
+        key = self.key.resolve(context)
+        if not key:
+            return self.nodelist.render(context)
+        html = get_fragment(key)
+        if html is None:
+            # Карточки без готовой миниатюры (posts.cards) снимают флаг
+            fragment = {'cacheable': True}
+            with context.push(feed_fragment=fragment):
+                html = self.nodelist.render(context)
+            if fragment['cacheable']:
+                set_fragment(key, html)
+        return html
+
+
+@register.tag
+def feedcache(parser, token):
+    """
+    Кэширует фрагмент ленты под ключом из posts.cache.feed_cache_key:
+    {% feedcache feed_key %} ... {% endfeedcache %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(
+            "'%s' принимает ровно один аргумент — ключ" % bits[0]
+        )
+    nodelist = parser.parse(('endfeedcache',))
+    parser.delete_first_token()
+    return FeedCacheNode(nodelist, parser.compile_filter(bits[1]))
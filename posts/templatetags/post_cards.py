@@ -0,0 +1,23 @@
+from django import template
+
+from posts.cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """
+    Карточки постов из кэша posts.cards: {% post_cards page %}
+    """
+    return render_cards(
+        posts, context.get('user'), context.get('feed_fragment')
+    )
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    """Карточка одного поста: {% post_card post %}"""
+    return render_cards(
+        [post], context.get('user'), context.get('feed_fragment')
+    )
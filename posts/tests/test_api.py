@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.http import parse_http_date
+
+from posts.models import Comment, Group, Post
+
+USER = get_user_model()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = USER.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        for i in range(settings.POSTS_PER_PAGE + 2):
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.author, group=cls.group
+            )
+        cls.post = Post.objects.first()
+        Comment.objects.create(
+            post=cls.post, author=cls.author, text='Комментарий'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_are_cursor_paginated(self):
+        """Ленты API листаются по курсору ссылкой next"""
+        for url in (
+            reverse('api_index'),
+            reverse('api_group', kwargs={'slug': 'group'}),
+            reverse('api_profile', kwargs={'username': 'author'}),
+        ):
+            with self.subTest(url=url):
+                first = self.client.get(url).json()
+                second = self.client.get(first['next']).json()
+                ids = [post['id'] for post in
+                       first['results'] + second['results']]
+                self.assertEqual(
+                    ids, list(Post.objects.values_list('id', flat=True))
+                )
+                self.assertIsNone(second['next'])
+                self.assertEqual(first['results'][0]['group'], 'group')
+
+    def test_post_and_comments(self):
+        """Пост и его комментарии отдаются в JSON"""
+        url = reverse('api_post', kwargs={'post_id': self.post.id})
+        self.assertEqual(self.client.get(url).json()['comments_count'], 1)
+        response = self.client.get(
+            reverse('api_comments', kwargs={'post_id': self.post.id})
+        )
+        self.assertEqual(response.json()['results'][0]['text'], 'Комментарий')
+        response = self.client.get(
+            reverse('api_comments', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_unchanged_feed_returns_not_modified(self):
+        """Повторный запрос с ETag отдаёт 304, пока лента не изменилась"""
+        url = reverse('api_index')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        # Только выборка страницы, без сериализации
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.post.text = 'Исправленный текст'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_validators_follow_own_rows(self):
+        """ETag ответа зависит только от его строк"""
+        url = reverse('api_profile', kwargs={'username': 'author'})
+        etag = self.client.get(url)['ETag']
+        other = USER.objects.create_user(username='other')
+        Post.objects.create(text='Чужой пост', author=other)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        url = reverse('api_post', kwargs={'post_id': self.post.id})
+        response = self.client.get(url)
+        Comment.objects.create(post=self.post, author=other, text='Ещё')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['comments_count'], 2)
+        self.assertGreaterEqual(
+            parse_http_date(changed['Last-Modified']),
+            parse_http_date(response['Last-Modified'])
+        )
@@ -0,0 +1,261 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.export import export_queryset, iter_rows
+from posts.models import Comment, Follow, Group, Post, UserStats
+from posts.search import find_posts
+
+User = get_user_model()
+
+
+class ImportArchiveTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.dir, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_jsonl(self, name, records):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return path
+
+    def write_csv(self, name, lines):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def run_import(self, full_rebuild=False, **files):
+        options = {
+            kind: [path] for kind, path in files.items()
+        }
+        out = io.StringIO()
+        call_command(
+            'import_archive', batch_size=2, checkpoint=self.checkpoint,
+            skip_thumbnails=True, full_rebuild=full_rebuild, stdout=out,
+            **options
+        )
+        return out.getvalue()
+
+    def posts(self, count):
+        return [
+            {
+                'id': 100 + i,
+                'text': f'Архивный пост {i}',
+                'author': 'alice' if i % 2 else 'bob',
+                'group': 'archive' if i == 0 else None,
+                'pub_date': f'2019-01-0{i + 1}T10:00:00',
+            }
+            for i in range(count)
+        ]
+
+    def test_archive_is_imported(self):
+        """Записи загружаются, затем пересчитываются счётчики и индекс"""
+        self.run_import(
+            groups=self.write_jsonl('groups.jsonl', [
+                {'title': 'Архив', 'slug': 'archive'}
+            ]),
+            posts=self.write_jsonl('posts.jsonl', self.posts(3)),
+            comments=self.write_csv('comments.csv', [
+                'post,author,text,created',
+                '100,carol,Первый,2019-02-01T10:00:00',
+                '100,alice,Второй,2019-02-02T10:00:00',
+            ]),
+            follows=self.write_jsonl('follows.jsonl', [
+                {'user': 'carol', 'author': 'alice'},
+                {'user': 'alice', 'author': 'alice'},
+            ]),
+        )
+        self.assertEqual(Post.objects.count(), 3)
+        post = Post.objects.get(id=100)
+        self.assertEqual(post.group, Group.objects.get(slug='archive'))
+        self.assertEqual(post.pub_date.year, 2019)
+        self.assertEqual(post.comments_count, 2)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(Follow.objects.count(), 1)
+        stats = UserStats.objects.get(user__username='alice')
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count), (1, 1)
+        )
+        self.assertEqual(find_posts('архивный').count(), 3)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        new_post = Post.objects.create(text='Новый', author=post.author)
+        self.assertGreater(new_post.id, 102)
+
+    def test_import_resumes_after_failure(self):
+        """После ошибки загрузка продолжается с последней пачки"""
+        records = self.posts(5)
+        records[0]['group'] = None
+        broken = dict(records[2], pub_date='вчера')
+        path = self.write_jsonl(
+            'posts.jsonl', records[:2] + [broken] + records[3:]
+        )
+        with self.assertRaises(CommandError):
+            self.run_import(posts=path)
+        self.assertEqual(Post.objects.count(), 2)
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)[f'posts:{path}'], 2)
+
+        self.write_jsonl('posts.jsonl', records)
+        self.run_import(posts=path)
+        self.assertEqual(
+            list(Post.objects.order_by('id').values_list('id', flat=True)),
+            [100, 101, 102, 103, 104]
+        )
+
+    def test_foreign_ids_are_rejected(self):
+        """Архивный пост с id существующего поста не теряется молча"""
+        author = User.objects.create_user(username='local')
+        existing = Post.objects.create(text='Местный пост', author=author)
+        records = self.posts(2)
+        records[0].update(id=existing.id, group=None)
+        comments = self.write_jsonl('comments.jsonl', [
+            {'post': existing.id, 'author': 'carol', 'text': 'Чужой'}
+        ])
+        with self.assertRaises(CommandError):
+            self.run_import(
+                posts=self.write_jsonl('posts.jsonl', records),
+                comments=comments
+            )
+        self.assertEqual(Post.objects.get(id=existing.id).text,
+                         'Местный пост')
+        self.assertFalse(Comment.objects.exists())
+
+    def test_record_without_date_is_rejected(self):
+        """Без даты запись не загружается: повтор пачки дал бы другую"""
+        records = self.posts(2)
+        records[0]['group'] = None
+        del records[1]['pub_date']
+        with self.assertRaises(CommandError):
+            self.run_import(posts=self.write_jsonl('posts.jsonl', records))
+        self.assertFalse(Post.objects.exists())
+
+    def test_throughput_is_reported(self):
+        """Скорость загрузки печатается при обычной подробности вывода"""
+        records = self.posts(2)
+        records[0]['group'] = None
+        out = self.run_import(posts=self.write_jsonl('posts.jsonl', records))
+        self.assertIn('в секунду', out)
+
+    def test_finish_is_limited_to_touched_users(self):
+        """Обслуживание после загрузки не трогает чужих постов"""
+        author = User.objects.create_user(username='local')
+        local = Post.objects.create(text='Местный пост', author=author)
+        Post.objects.filter(pk=local.pk).update(comments_count=5)
+        records = self.posts(2)
+        records[0]['group'] = None
+        path = self.write_jsonl('posts.jsonl', records)
+        self.run_import(posts=path)
+        self.assertEqual(Post.objects.get(pk=local.pk).comments_count, 5)
+        self.assertEqual(
+            UserStats.objects.get(user__username='alice').posts_count, 1
+        )
+
+        self.run_import(posts=path, full_rebuild=True)
+        self.assertEqual(Post.objects.get(pk=local.pk).comments_count, 0)
+
+    def test_replayed_batch_is_skipped(self):
+        """Повтор уже записанной пачки (сбой до контрольной точки)"""
+        records = self.posts(3)
+        records[0]['group'] = None
+        path = self.write_jsonl('posts.jsonl', records)
+        self.run_import(posts=path)
+        self.run_import(posts=path)
+        self.assertEqual(Post.objects.count(), 3)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.author,
+                group=cls.group if i % 2 else None
+            )
+            for i in range(5)
+        ]
+        Post.objects.create(text='Чужой пост', author=cls.other)
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.other, text='Комментарий'
+        )
+
+    def test_export_walks_table_in_windows(self):
+        """Выгрузка идёт окнами и сохраняет все записи по порядку"""
+        queryset = export_queryset('posts', author='author')
+        with self.assertNumQueries(3):
+            rows = list(iter_rows('posts', queryset, chunk_size=2))
+        self.assertEqual(
+            [row['id'] for row in rows], [post.id for post in self.posts]
+        )
+        rows = list(iter_rows('posts', export_queryset(
+            'posts', group='group'
+        )))
+        self.assertEqual([row['group'] for row in rows], ['group', 'group'])
+
+    def test_export_can_be_imported_back(self):
+        """Выгрузка команды export_archive загружается import_archive"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        posts = os.path.join(directory, 'posts.csv')
+        comments = os.path.join(directory, 'comments.jsonl')
+        call_command('export_archive', 'posts', format='csv', output=posts)
+        call_command('export_archive', 'comments', output=comments)
+        Post.objects.all().delete()
+        self.assertFalse(Comment.objects.exists())
+        call_command(
+            'import_archive', posts=[posts], comments=[comments],
+            checkpoint=os.path.join(directory, 'checkpoint.json'),
+            skip_thumbnails=True, stdout=io.StringIO()
+        )
+        self.assertEqual(Post.objects.count(), 6)
+        self.assertEqual(
+            Post.objects.get(id=self.posts[1].id).group, self.group
+        )
+        self.assertEqual(
+            Post.objects.get(id=self.posts[0].id).pub_date,
+            self.posts[0].pub_date
+        )
+        self.assertEqual(Comment.objects.get().post_id, self.posts[0].id)
+
+    def test_export_writes_to_command_stdout(self):
+        """Без --output выгрузка пишется в stdout команды"""
+        out = io.StringIO()
+        call_command('export_archive', 'posts', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(
+            {json.loads(line)['id'] for line in lines},
+            set(Post.objects.values_list('id', flat=True))
+        )
+
+    def test_admin_action_streams_selection(self):
+        """Действие админки отдаёт выбранные посты потоком"""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('admin:posts_post_changelist'), {
+                'action': 'export_csv',
+                '_selected_action': [self.posts[0].id, self.posts[1].id],
+            }
+        )
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,text,author,group,pub_date,image')
+        self.assertEqual(len(lines), 3)
@@ -0,0 +1,209 @@
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import Http404
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from posts import cards, lookups
+from posts.cache import CARDS_VERSION_KEY, cards_version
+from posts.lookups import lookup_key
+from posts.models import Comment, Group, Post
+from yatube.backends import tiered_cache
+from yatube.backends.tiered_cache import TieredCache
+from yatube.caches import parse_cache_url
+
+User = get_user_model()
+
+
+class CacheUrlTests(SimpleTestCase):
+    def test_file_url(self):
+        config = parse_cache_url(
+            'file:///var/cache/yatube?timeout=120&max_entries=5000'
+        )
+        self.assertEqual(
+            config['BACKEND'],
+            'django.core.cache.backends.filebased.FileBasedCache'
+        )
+        self.assertEqual(config['LOCATION'], '/var/cache/yatube')
+        self.assertEqual(config['TIMEOUT'], 120)
+        self.assertEqual(config['OPTIONS'], {'MAX_ENTRIES': 5000})
+
+    def test_redis_url(self):
+        config = parse_cache_url('redis://127.0.0.1:6379/1?key_prefix=yt')
+        self.assertEqual(config['LOCATION'], 'redis://127.0.0.1:6379/1')
+        self.assertEqual(config['KEY_PREFIX'], 'yt')
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            parse_cache_url('mongodb://cache')
+
+
+class TieredCacheTests(SimpleTestCase):
+    """Два экземпляра с разными LOCATION — два процесса с общим кэшем"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'shared': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self.directory,
+            },
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        tiered_cache._tiers.clear()
+        self.first = self.process('first')
+        self.second = self.process('second')
+
+    @staticmethod
+    def process(name, max_entries=100):
+        return TieredCache(name, {'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_PREFIXES': ('feed_fragment:',),
+            'LOCAL_MAX_ENTRIES': max_entries,
+        }})
+
+    def test_fragment_is_shared_then_local(self):
+        """Фрагмент одного процесса другой берёт из общего кэша, потом
+        из своей памяти"""
+        self.first.set('feed_fragment:index:1', '<p>лента</p>')
+        self.assertEqual(
+            self.second.get('feed_fragment:index:1'), '<p>лента</p>'
+        )
+        self.second.shared.clear()
+        self.assertEqual(
+            self.second.get('feed_fragment:index:1'), '<p>лента</p>'
+        )
+        stats = self.second.tier_stats()
+        self.assertEqual(stats['local']['hits'], 1)
+        self.assertEqual(stats['local']['misses'], 1)
+        self.assertEqual(stats['shared']['hits'], 1)
+        self.assertEqual(stats['local']['entries'], 1)
+
+    def test_version_is_shared_only(self):
+        """Новая версия лент из одного процесса сразу видна другому"""
+        self.first.add(CARDS_VERSION_KEY, 1, None)
+        self.assertEqual(self.second.get(CARDS_VERSION_KEY), 1)
+        self.first.incr(CARDS_VERSION_KEY)
+        self.assertEqual(self.second.get(CARDS_VERSION_KEY), 2)
+        self.assertEqual(self.second.tier_stats()['local']['entries'], 0)
+
+    def test_local_tier_is_lru(self):
+        cache = self.process('small', max_entries=2)
+        for name in ('a', 'b'):
+            cache.set('feed_fragment:' + name, name)
+        cache.get('feed_fragment:a')
+        cache.set('feed_fragment:c', 'c')
+        cache.shared.clear()
+        self.assertEqual(
+            cache.get_many(['feed_fragment:a', 'feed_fragment:b',
+                            'feed_fragment:c']),
+            {'feed_fragment:a': 'a', 'feed_fragment:c': 'c'}
+        )
+
+    def test_delete_reaches_both_tiers(self):
+        self.first.set('feed_fragment:index:1', 'html')
+        self.first.delete('feed_fragment:index:1')
+        self.assertIsNone(self.first.get('feed_fragment:index:1'))
+        self.assertIsNone(self.second.get('feed_fragment:index:1'))
+
+
+class LookupCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_found_objects_are_cached(self):
+        group = Group.objects.create(title='Сообщество', slug='group')
+        author = User.objects.create_user(username='author')
+        lookups.get_group_or_404('group')
+        lookups.get_author_or_404('author')
+        with self.assertNumQueries(0):
+            self.assertEqual(lookups.get_group_or_404('group'), group)
+            self.assertEqual(lookups.get_author_or_404('author'), author)
+
+    def test_user_is_cached_without_secrets(self):
+        """В общий кэш не попадают хэш пароля и почта"""
+        User.objects.create_user(
+            username='author', email='author@example.com', password='secret'
+        )
+        lookups.get_author_or_404('author')
+        cached = cache.get(lookup_key(User, 'author'))
+        self.assertEqual(cached.username, 'author')
+        self.assertNotIn('password', cached.__dict__)
+        self.assertNotIn('email', cached.__dict__)
+
+    def test_misses_are_cached(self):
+        """Несуществующий автор даёт 404, повторно — без запроса к базе"""
+        url = reverse('profile', kwargs={'username': 'nobody'})
+        self.assertEqual(Client().get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            with self.assertRaises(Http404):
+                lookups.get_author_or_404('nobody')
+        User.objects.create_user(username='nobody')
+        self.assertEqual(Client().get(url).status_code, 200)
+
+    def test_rename_forgets_old_value(self):
+        group = Group.objects.create(title='Сообщество', slug='old')
+        lookups.get_group_or_404('old')
+        group.slug = 'new'
+        group.save()
+        with self.assertRaises(Http404):
+            lookups.get_group_or_404('old')
+        self.assertEqual(lookups.get_group_or_404('new').slug, 'new')
+        group.delete()
+        with self.assertRaises(Http404):
+            lookups.get_group_or_404('new')
+
+
+class CardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(text='Пост', author=self.author)
+
+    def render(self, user=None):
+        return cards.render_cards(Post.objects.for_feed(), user)
+
+    def test_card_is_shared_by_viewers(self):
+        """Карточка рендерится один раз, кнопку автора добавляет вывод"""
+        author_html = self.render(self.author)
+        with self.assertTemplateNotUsed('post_item.html'):
+            reader_html = self.render(self.reader)
+        self.assertIn('Редактировать', author_html)
+        self.assertNotIn('Редактировать', reader_html)
+        self.assertNotIn(cards.ACTIONS_MARKER, author_html)
+
+    def test_changes_give_new_card(self):
+        self.render()
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        self.assertIn('Исправленный пост', self.render())
+        Comment.objects.create(text='Ответ', post=self.post,
+                               author=self.reader)
+        self.assertIn('Комментариев: 1', self.render())
+        self.author.username = 'renamed'
+        self.author.save()
+        self.assertIn('@renamed', self.render())
+
+    def test_unrelated_changes_keep_cards(self):
+        """Карточки сбрасываются, только если изменились их поля"""
+        group = Group.objects.create(title='Группа', slug='group')
+        version = cards_version()
+        self.author.first_name = 'Лев'
+        self.author.save()
+        User.objects.get(pk=self.author.pk).save()
+        group.description = 'Описание'
+        group.save()
+        self.assertEqual(cards_version(), version)
+        group.title = 'Новое название'
+        group.save()
+        self.assertNotEqual(cards_version(), version)
@@ -0,0 +1,52 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from yatube.db import parse_database_url
+
+
+class DatabaseUrlTests(SimpleTestCase):
+    def test_sqlite_url(self):
+        """Адрес SQLite даёт путь к файлу и параметры драйвера"""
+        config = parse_database_url(
+            'sqlite:////var/db/yatube.sqlite3?timeout=20'
+        )
+        self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(config['NAME'], '/var/db/yatube.sqlite3')
+        self.assertEqual(config['OPTIONS'], {'timeout': 20.0})
+
+    def test_postgres_url(self):
+        """Соединения PostgreSQL постоянные, с пулом — возвращаются в пул"""
+        config = parse_database_url(
+            'postgres://user:p%40ss@db:5433/yatube?sslmode=require'
+        )
+        self.assertEqual(
+            (config['USER'], config['PASSWORD'], config['HOST'],
+             config['PORT'], config['NAME']),
+            ('user', 'p@ss', 'db', '5433', 'yatube')
+        )
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertEqual(config['OPTIONS'], {'sslmode': 'require'})
+        config = parse_database_url(
+            'postgres+pool://db/yatube?pool_max=20&pool_timeout=5'
+        )
+        self.assertEqual(config['ENGINE'], 'yatube.backends.postgresql_pool')
+        self.assertEqual(
+            config['POOL'], {'min_size': 1, 'max_size': 20, 'timeout': 5.0}
+        )
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            parse_database_url('mysql://db/yatube')
+
+
+class SqlitePragmaTests(TestCase):
+    def test_connection_is_configured(self):
+        """Новое соединение SQLite настраивается обработчиком"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Только для SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
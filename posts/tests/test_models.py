@@ -1,5 +1,12 @@
-from django.test import TestCase
-from posts.models import Post, Group
+import re
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from posts import timeline
+from posts.models import Comment, Follow, Post, Group, UserStats
 from django.contrib.auth import get_user_model
 
 USER = get_user_model()
@@ -94,3 +101,131 @@ class PostModelTests(TestCase):
         model = PostModelTests.model_post
         expected_title = model.text[:15]
         self.assertEquals(expected_title, str(model))
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = USER.objects.create(username='author')
+        cls.reader = USER.objects.create(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_post_counter(self):
+        """Счётчик записей автора следует за созданием и удалением постов"""
+        post = Post.objects.create(text='Текст', author=self.author)
+        Post.objects.create(text='Текст', author=self.author)
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+
+    def test_comment_counter(self):
+        """Счётчик комментариев поста следует за комментариями"""
+        post = Post.objects.create(text='Текст', author=self.author)
+        comment = Comment.objects.create(
+            text='Комментарий', author=self.reader, post=post
+        )
+        Comment.objects.create(
+            text='Комментарий', author=self.reader, post=post
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_follow_counters(self):
+        """Счётчики подписчиков и подписок следуют за подписками"""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_recount_command_repairs_counters(self):
+        """Команда recount_counters исправляет рассогласованные счётчики"""
+        post = Post.objects.create(text='Текст', author=self.author)
+        Comment.objects.create(
+            text='Комментарий', author=self.reader, post=post
+        )
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        out = StringIO()
+        call_command('recount_counters', stdout=out)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+        self.assertIn('постов: 1', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN SQLite')
+@override_settings(FOLLOW_TIMELINE_ENABLED=True)
+class IndexUsageTests(TestCase):
+    """Запросы лент читают индексы без полного просмотра и сортировки"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = USER.objects.create(username='author')
+        cls.reader = USER.objects.create(username='reader')
+        cls.group = Group.objects.create(title='Сообщество', slug='slug')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(20):
+            post = Post.objects.create(
+                text=f'Текст {i}', author=cls.author, group=cls.group
+            )
+            Comment.objects.create(
+                text='Комментарий', author=cls.reader, post=post
+            )
+
+    def assertUsesIndexes(self, queryset, sort_allowed=False):
+        plan = queryset if isinstance(queryset, str) else queryset.explain()
+        if not sort_allowed:
+            self.assertNotIn('USE TEMP B-TREE', plan)
+        for line in plan.splitlines():
+            self.assertIsNone(
+                re.search(r'\bSCAN \w+$', line),
+                f'Полный просмотр таблицы: {line}'
+            )
+
+    def test_feed_queries_use_indexes(self):
+        """Главная, сообщество, профиль и подписки читаются по индексам"""
+        feeds = {
+            'index': Post.objects.for_feed(),
+            'group': Post.objects.for_feed().filter(group=self.group),
+            'profile': Post.objects.for_feed().filter(author=self.author),
+            'follow_index': timeline.follow_feed(self.reader),
+        }
+        for name, queryset in feeds.items():
+            with self.subTest(feed=name):
+                self.assertUsesIndexes(queryset[:10])
+
+    @override_settings(FOLLOW_TIMELINE_ENABLED=False)
+    def test_follow_feed_without_timeline_uses_indexes(self):
+        """
+        Лента подписок по умолчанию: подписки по индексу (user, author),
+        посты каждого автора по индексу автора. Посты нескольких авторов
+        сливаются сортировкой, это единственная допустимая сортировка
+        """
+        plan = timeline.follow_feed(self.reader)[:10].explain()
+        self.assertUsesIndexes(plan, sort_allowed=True)
+        self.assertRegex(plan, r'SEARCH posts_follow USING .*\(user_id=\?')
+        self.assertRegex(plan, r'SEARCH posts_post USING .*\(author_id=\?')
+
+    def test_lookup_queries_use_indexes(self):
+        """Комментарии поста и пара подписки ищутся по индексам"""
+        post = Post.objects.first()
+        queries = {
+            'comments': post.comments.select_related('author'),
+            'follow': Follow.objects.filter(
+                user=self.reader, author=self.author
+            ),
+        }
+        for name, queryset in queries.items():
+            with self.subTest(query=name):
+                self.assertUsesIndexes(queryset)
@@ -0,0 +1,118 @@
+"""
+Проверка со второй базой SQLite вместо реплики:
+
+    REPLICA_DATABASE_URL=sqlite:////tmp/replica.sqlite3 \
+        python manage.py test posts
+
+В тестах реплика — зеркало основной базы (TEST MIRROR) и чтение идёт
+в основную; отставание моделирует только ReplicaReadYourWritesTests.
+"""
+import copy
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from posts.models import Post
+from yatube.replicas import ReplicaRouter, ReplicaStickinessMiddleware
+
+User = get_user_model()
+
+
+@mock.patch('yatube.replicas.replica_alias', return_value='replica')
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def reads_during(self, request, write=False):
+        """Базы, с которых читает запрос до и после записи"""
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Post))
+            if write:
+                self.assertEqual(self.router.db_for_write(Post), 'default')
+                reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+        response = ReplicaStickinessMiddleware(view)(request)
+        return reads, response
+
+    def test_reads_go_to_replica(self, replica_alias):
+        reads, response = self.reads_during(self.factory.get('/'))
+        self.assertEqual(reads, ['replica'])
+        self.assertNotIn(settings.REPLICA_COOKIE_NAME, response.cookies)
+
+    def test_write_pins_request_and_sets_cookie(self, replica_alias):
+        """После записи запрос читает с основной базы и ставит cookie"""
+        reads, response = self.reads_during(
+            self.factory.get('/'), write=True
+        )
+        self.assertEqual(reads, ['replica', 'default'])
+        cookie = response.cookies[settings.REPLICA_COOKIE_NAME]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+        reads, _ = self.reads_during(self.factory.get('/'))
+        self.assertEqual(reads, ['replica'])
+
+    def test_sticky_requests_read_primary(self, replica_alias):
+        """С cookie и в POST-запросах чтение идёт с основной базы"""
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_COOKIE_NAME] = '1'
+        self.assertEqual(self.reads_during(request)[0], ['default'])
+        self.assertEqual(
+            self.reads_during(self.factory.post('/'))[0], ['default']
+        )
+
+
+@skipUnless(
+    settings.REPLICA_DATABASE_ALIAS in settings.DATABASES,
+    'Нужна реплика: REPLICA_DATABASE_URL'
+)
+class ReplicaReadYourWritesTests(TestCase):
+    """
+    Вместо зеркала реплика здесь — отдельная пустая база, как сильно
+    отставшая
+    """
+    databases = {'default', settings.REPLICA_DATABASE_ALIAS}
+
+    @classmethod
+    def setUpClass(cls):
+        replica = connections[settings.REPLICA_DATABASE_ALIAS]
+        cls.mirror_settings = replica.settings_dict
+        replica.close()
+        replica.settings_dict = copy.deepcopy(
+            settings.DATABASES[settings.REPLICA_DATABASE_ALIAS]
+        )
+        replica.settings_dict['TEST'].update(MIRROR=None, NAME=None)
+        cls.replica_name = replica.settings_dict['NAME']
+        replica.creation.create_test_db(verbosity=0, serialize=False)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        replica = connections[settings.REPLICA_DATABASE_ALIAS]
+        replica.creation.destroy_test_db(cls.replica_name, verbosity=0)
+        replica.settings_dict = cls.mirror_settings
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.client = Client()
+        self.client.force_login(self.author)
+        # Вход записал сессию; начинаем с чистого листа
+        self.client.cookies.pop(settings.REPLICA_COOKIE_NAME, None)
+
+    def test_author_sees_own_post_after_redirect(self):
+        Post.objects.create(text='Ещё не на реплике', author=self.author)
+        guest = Client().get(reverse('index'))
+        self.assertNotContains(guest, 'Ещё не на реплике')
+        response = self.client.post(
+            reverse('new_post'), {'text': 'Свежий пост'}, follow=True
+        )
+        self.assertContains(response, 'Свежий пост')
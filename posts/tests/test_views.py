@@ -1,14 +1,30 @@
+import io
+import json
+import os
 import shutil
 import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
 from django import forms
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.conf import settings
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import Page
 
-from posts.models import Group, Post, Follow
+from posts import lookups, profiling, search, thumbnails, trending
+from posts.cache import SCOPE_KEY, feed_cache_stats
+from posts.models import (
+    Comment, Group, Post, PostScore, Follow, TimelineEntry
+)
+from posts.paginators import CursorPaginator, FeedPaginator
 
 USER = get_user_model()
 
@@ -144,20 +160,258 @@ class PaginatorViewsTest(TestCase):
         response = self.client.get(reverse('index') + '?page=2')
         self.assertEqual(len(response.context.get('page').object_list), 3)
 
+    def test_fragment_has_only_cards(self):
+        """?fragment=1 отдаёт карточки и ссылку на следующие без страницы"""
+        cache.clear()
+        url = reverse('profile', kwargs={'username': 'tester'})
+        response = self.authorised_client.get(url, {'fragment': 1})
+        self.assertTemplateUsed(response, 'feed_fragment.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(len(response.context['page'].object_list), 10)
+        self.assertEqual(
+            response['Link'], f'<{url}?fragment=1&page=2>; rel="next"'
+        )
+        self.assertContains(response, 'data-load-more')
+        response = self.authorised_client.get(
+            url, {'fragment': 1, 'page': 2}
+        )
+        self.assertEqual(len(response.context['page'].object_list), 3)
+        self.assertFalse(response.has_header('Link'))
+        self.assertNotContains(response, 'data-load-more')
+
+
+class FeedPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = USER.objects.create_user(username='author')
+        for i in range(25):
+            Post.objects.create(text=f'Пост {i}', author=author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_wrong_count_does_not_change_pages(self):
+        """Неточное число влияет только на номера страниц"""
+        posts = Post.objects.order_by('-pub_date', '-id')
+        paginator = FeedPaginator(posts, 10, count=1000)
+        page = paginator.get_page(2)
+        self.assertEqual(list(page), list(posts[10:20]))
+        self.assertTrue(page.has_next())
+        page = paginator.get_page(3)
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_next())
+        self.assertEqual(paginator.num_pages, 3)
+        page = FeedPaginator(posts, 10, count=10).get_page(50)
+        self.assertEqual(page.number, 3)
+        self.assertIs(type(page), Page)
+
+    def test_page_window(self):
+        paginator = FeedPaginator(list(range(500)), 1, count=500)
+        self.assertEqual(
+            paginator.get_page(250).elided_page_range,
+            [1, '…', 248, 249, 250, 251, 252, '…', 500]
+        )
+        self.assertEqual(
+            paginator.get_page(1).elided_page_range,
+            [1, 2, 3, '…', 500]
+        )
+
+    def test_index_count_is_cached(self):
+        """Главная не выполняет COUNT(*), пока число постов в кэше"""
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('index'), {'page': 2})
+        self.assertEqual(response.context['page'].paginator.num_pages, 3)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in context.captured_queries
+        ))
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.test_user = USER.objects.create_user(username='tester')
+        for i in range(25):
+            Post.objects.create(
+                text=f'Тестовый текст поста {i}',
+                author=cls.test_user
+            )
+        cls.expected = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_follow_each_other(self):
+        """Страницы по курсору идут подряд без пропусков и повторов"""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        page = paginator.get_page()
+        collected = list(page)
+        self.assertFalse(page.has_previous())
+        while page.has_next():
+            page = paginator.get_page(after=page.next_cursor)
+            collected.extend(page)
+        self.assertEqual(collected, CursorPaginatorTests.expected)
+        self.assertEqual(len(page), 5)
+
+    def test_before_returns_previous_page(self):
+        """Курсор before возвращает предыдущую страницу"""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        second = paginator.get_page(after=paginator.get_page().next_cursor)
+        first = paginator.get_page(before=second.previous_cursor)
+        self.assertEqual(list(first), CursorPaginatorTests.expected[:10])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Повреждённый курсор даёт первую страницу"""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        for token in ('мусор', 'bm90LWpzb24', 'WzEsIDJd'):
+            with self.subTest(token=token):
+                page = paginator.get_page(after=token)
+                self.assertEqual(
+                    list(page), CursorPaginatorTests.expected[:10]
+                )
+
+    @override_settings(CURSOR_PAGINATED_FEEDS=('index',))
+    def test_index_uses_cursor_when_enabled(self):
+        """Главная страница листается по курсору, если это включено"""
+        response = self.client.get(reverse('index'))
+        page = response.context['page']
+        self.assertTrue(page.is_cursor)
+        self.assertContains(response, f'?after={page.next_cursor}')
+        response = self.client.get(
+            reverse('index') + f'?after={page.next_cursor}'
+        )
+        self.assertEqual(
+            list(response.context['page']),
+            CursorPaginatorTests.expected[10:20]
+        )
+
+
+class QueryCountTests(TestCase):
+    """Число запросов страницы не зависит от числа постов на ней"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = USER.objects.create_user(username='reader')
+        cls.author = USER.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовое сообщество',
+            slug='test-slug'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = cls.create_posts(1)
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def create_posts(cls, count):
+        for i in range(count):
+            commentator = USER.objects.create_user(
+                username=f'commentator-{Post.objects.count()}'
+            )
+            post = Post.objects.create(
+                text=f'Тестовый текст поста {i}',
+                author=cls.author,
+                group=cls.group
+            )
+            Comment.objects.create(
+                text='Комментарий', author=commentator, post=post
+            )
+        return post
+
+    def count_queries(self, url):
+        client = Client()
+        client.force_login(QueryCountTests.reader)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_feeds_query_count_is_constant(self):
+        """Ленты выполняют постоянное и ограниченное число запросов"""
+        post = QueryCountTests.post
+        # Сообщество и автор берутся из кэша (posts.lookups)
+        limits = {
+            reverse('index'): 4,
+            reverse('group', kwargs={'slug': 'test-slug'}): 4,
+            reverse('profile', kwargs={'username': 'author'}): 6,
+            reverse('post', kwargs={
+                'username': 'author', 'post_id': post.id}): 5,
+            reverse('follow_index'): 4,
+        }
+        lookups.get_group_or_404('test-slug')
+        lookups.get_author_or_404('author')
+        before = {url: self.count_queries(url) for url in limits}
+        QueryCountTests.create_posts(9)
+        for url, limit in limits.items():
+            with self.subTest(url=url):
+                queries = self.count_queries(url)
+                self.assertEqual(queries, before[url])
+                self.assertLessEqual(queries, limit)
+
 
 class CachTests(TestCase):
+    def setUp(self):
+        cache.clear()
 
     def test_index_cached_correctly(self):
         """Главная страница кэшируется"""
         user_client = Client()
         test_user = USER.objects.create_user(username='tester')
-        response_before = user_client.get(reverse('index'))
         Post.objects.create(
             text='Текст',
             author=test_user
         )
+        response_before = user_client.get(reverse('index'))
+        hits_before = feed_cache_stats()['hits']
         response_after = user_client.get(reverse('index'))
         self.assertEqual(response_before.content, response_after.content)
+        self.assertEqual(feed_cache_stats()['hits'], hits_before + 1)
+
+    def test_index_cache_invalidated_by_new_post(self):
+        """Новый пост сразу появляется на закэшированной главной"""
+        user_client = Client()
+        test_user = USER.objects.create_user(username='tester')
+        user_client.get(reverse('index'))
+        Post.objects.create(
+            text='Свежий пост',
+            author=test_user
+        )
+        response = user_client.get(reverse('index'))
+        self.assertContains(response, 'Свежий пост')
+
+    def test_pages_cached_separately(self):
+        """Вторая страница не получает HTML первой"""
+        test_user = USER.objects.create_user(username='tester')
+        for i in range(13):
+            Post.objects.create(
+                text=f'Пост номер {i:02}',
+                author=test_user
+            )
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('index') + '?page=2')
+        self.assertContains(response, 'Пост номер 00')
+        self.assertNotContains(response, 'Пост номер 12')
+
+    def test_follow_feed_cached_per_user(self):
+        """Лента подписок одного пользователя не видна другому"""
+        author = USER.objects.create_user(username='author')
+        follower = USER.objects.create_user(username='follower')
+        stranger = USER.objects.create_user(username='stranger')
+        Follow.objects.create(user=follower, author=author)
+        Post.objects.create(text='Пост для подписчиков', author=author)
+        follower_client = Client()
+        follower_client.force_login(follower)
+        stranger_client = Client()
+        stranger_client.force_login(stranger)
+        follower_client.get(reverse('follow_index'))
+        response = stranger_client.get(reverse('follow_index'))
+        self.assertNotContains(response, 'Пост для подписчиков')
 
 
 class FollowTests(TestCase):
@@ -229,3 +483,641 @@ class FollowTests(TestCase):
         unsubscribed = FollowTests.unsubscribed_client
         response_unsubscribed = unsubscribed.get(reverse('follow_index'))
         self.assertFalse(response_unsubscribed.context['posts'])
+
+
+@override_settings(FOLLOW_TIMELINE_ENABLED=True)
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = USER.objects.create_user(username='author')
+        cls.author_client = Client()
+        cls.author_client.force_login(cls.author)
+        cls.follower = USER.objects.create_user(username='follower')
+        cls.follower_client = Client()
+        cls.follower_client.force_login(cls.follower)
+        cls.old_post = Post.objects.create(
+            text='Старый пост',
+            author=cls.author
+        )
+
+    def follow(self):
+        self.follower_client.get(reverse(
+            'profile_follow', kwargs={'username': 'author'}
+        ))
+
+    def feed(self):
+        response = self.follower_client.get(reverse('follow_index'))
+        return list(response.context['page'])
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка добавляет посты автора в ленту, отписка убирает"""
+        self.follow()
+        self.assertEqual(self.feed(), [TimelineTests.old_post])
+        self.follower_client.get(reverse(
+            'profile_unfollow', kwargs={'username': 'author'}
+        ))
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), [])
+
+    def test_follow_backfills_every_post(self):
+        """Новый подписчик получает все посты автора, а не последние"""
+        for i in range(4):
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+        with mock.patch('posts.timeline.BATCH_SIZE', 2):
+            self.follow()
+        self.assertEqual(
+            TimelineEntry.objects.filter(
+                user=TimelineTests.follower
+            ).count(),
+            Post.objects.filter(author=TimelineTests.author).count()
+        )
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост раскладывается в ленты подписчиков"""
+        self.follow()
+        self.author_client.post(
+            reverse('new_post'), data={'text': 'Новый пост'}
+        )
+        new_post = Post.objects.get(text='Новый пост')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=TimelineTests.follower, post=new_post
+        ).exists())
+        self.assertEqual(self.feed(), [new_post, TimelineTests.old_post])
+
+    @override_settings(FOLLOW_TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_is_read_on_demand(self):
+        """Посты популярного автора читаются без раскладки по лентам"""
+        self.follow()
+        self.author_client.post(
+            reverse('new_post'), data={'text': 'Новый пост'}
+        )
+        new_post = Post.objects.get(text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), [new_post, TimelineTests.old_post])
+
+    @override_settings(FOLLOW_TIMELINE_FANOUT_LIMIT=1)
+    def test_author_crossing_fanout_limit(self):
+        """
+        Пост, написанный, пока автор был популярным, остаётся в ленте
+        и после того, как подписчиков стало меньше
+        """
+        self.follow()
+        other = USER.objects.create_user(username='other')
+        Follow.objects.create(user=other, author=self.author)
+        popular_post = Post.objects.create(
+            text='Популярный', author=self.author
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=popular_post).exists()
+        )
+        self.assertEqual(self.feed(), [popular_post, TimelineTests.old_post])
+        Follow.objects.filter(user=other).delete()
+        self.assertEqual(self.feed(), [popular_post, TimelineTests.old_post])
+        new_post = Post.objects.create(
+            text='Снова обычный', author=self.author
+        )
+        self.assertEqual(
+            self.feed(), [new_post, popular_post, TimelineTests.old_post]
+        )
+
+    @override_settings(CURSOR_PAGINATED_FEEDS=('follow_index',))
+    def test_timeline_cursor_pagination(self):
+        """Материализованная лента листается по курсору"""
+        for i in range(12):
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+        self.follow()
+        response = self.follower_client.get(reverse('follow_index'))
+        page = response.context['page']
+        response = self.follower_client.get(
+            reverse('follow_index') + f'?after={page.next_cursor}'
+        )
+        self.assertEqual(
+            list(page) + list(response.context['page']),
+            list(Post.objects.filter(author=self.author))
+        )
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    THUMBNAIL_QUEUE_BACKEND='sync'
+)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.test_user = USER.objects.create_user(username='tester')
+        cls.small_gif = small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=cls.test_user,
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=small_gif,
+                content_type='image/gif'
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_page_does_not_wait_for_thumbnail(self):
+        """Пока миниатюры нет, карточка показывает оригинал"""
+        response = self.client.get(reverse('index'))
+        self.assertIsNone(
+            thumbnails.cached_thumbnail(self.post.image, 'card')
+        )
+        self.assertContains(response, f'src="{self.post.image.url}"')
+
+    def test_generated_thumbnail_is_shown(self):
+        """После генерации карточка показывает миниатюру"""
+        thumbnails.enqueue(self.post.image.name)
+        thumbnail = thumbnails.cached_thumbnail(self.post.image, 'card')
+        self.assertIsNotNone(thumbnail)
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, f'src="{thumbnail.url}"')
+
+    def test_cached_page_picks_up_new_thumbnail(self):
+        """Лента из кэша не ссылается на оригинал после генерации"""
+        self.client.get(reverse('index'))
+        thumbnails.enqueue(self.post.image.name)
+        thumbnail = thumbnails.cached_thumbnail(self.post.image, 'card')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, f'src="{thumbnail.url}"')
+
+    @override_settings(THUMBNAIL_QUEUE_BACKEND='thread')
+    def test_missing_thumbnail_is_queued_on_view(self):
+        """Картинка без миниатюры ставится в очередь при показе"""
+        with mock.patch('posts.thumbnails.enqueue') as enqueue:
+            self.client.get(reverse('index'))
+        enqueue.assert_called_once_with(self.post.image.name)
+
+    @override_settings(THUMBNAIL_QUEUE_BACKEND='thread')
+    def test_failed_image_is_not_requeued(self):
+        """Картинка с ошибкой генерации не ставится в очередь при показе"""
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            thumbnails._run('posts/lost.gif')
+        self.assertEqual(
+            thumbnails.failed_images(['posts/lost.gif']), {'posts/lost.gif'}
+        )
+        thumbnails.mark_failed(self.post.image.name)
+        with mock.patch('posts.thumbnails.enqueue') as enqueue:
+            self.client.get(reverse('index'))
+            self.client.get(reverse('index'))
+        enqueue.assert_not_called()
+
+    def test_page_thumbnails_are_read_together(self):
+        """Миниатюры карточек страницы — один запрос к хранилищу ключей"""
+        for name in ('first.gif', 'second.gif'):
+            Post.objects.create(
+                text='Ещё картинка', author=self.test_user,
+                image=SimpleUploadedFile(name, self.small_gif, 'image/gif')
+            )
+        posts = list(Post.objects.exclude(image=''))
+        for post in posts:
+            thumbnails.enqueue(post.image.name)
+        cache.clear()
+        with self.assertNumQueries(1):
+            thumbnails.attach_thumbnails(posts, 'card')
+        self.assertTrue(all(post.card_thumbnail for post in posts))
+        with self.assertNumQueries(0):
+            thumbnails.attach_thumbnails(posts, 'card')
+
+    def test_image_meta_is_saved_with_form(self):
+        """Размеры и заглушка картинки считаются при сохранении формы"""
+        client = Client()
+        client.force_login(self.test_user)
+        client.post(reverse('new_post'), data={
+            'text': 'Пост с размерами',
+            'image': SimpleUploadedFile('meta.gif', self.small_gif,
+                                        'image/gif'),
+        })
+        post = Post.objects.get(text='Пост с размерами')
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertEqual(post.image_size, len(self.small_gif))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'width="2" height="1"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_backfill_image_meta(self):
+        call_command('backfill_image_meta', stdout=io.StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.image_width, self.post.image_height),
+                         (2, 1))
+
+    def test_backfill_logs_unreadable_image(self):
+        """
+        Нечитаемая картинка попадает в журнал с именем файла один раз:
+        следующий запуск её пропускает
+        """
+        Post.objects.create(
+            text='Без файла', author=self.test_user, image='posts/lost.gif'
+        )
+        with self.assertLogs(
+            'posts.management.commands.backfill_image_meta', 'ERROR'
+        ) as logs:
+            call_command('backfill_image_meta', stdout=io.StringIO())
+        self.assertIn('posts/lost.gif', logs.output[0])
+        self.assertEqual(
+            Post.objects.get(image='posts/lost.gif').image_size, 0
+        )
+        with self.assertRaises(AssertionError):
+            # Отмеченная картинка не читается и не попадает в журнал
+            with self.assertLogs(
+                'posts.management.commands.backfill_image_meta', 'ERROR'
+            ):
+                call_command('backfill_image_meta', stdout=io.StringIO())
+
+    def test_imported_image_gets_meta(self):
+        """import_archive заполняет размеры загруженных картинок"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'posts.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'text': 'Из архива', 'author': 'tester',
+                'pub_date': '2019-01-01T10:00:00',
+                'image': self.post.image.name,
+            }, f)
+        call_command(
+            'import_archive', posts=[path], skip_thumbnails=True,
+            checkpoint=os.path.join(directory, 'checkpoint.json'),
+            stdout=io.StringIO()
+        )
+        post = Post.objects.get(text='Из архива')
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = USER.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Ботаника', slug='botany', description='Растения'
+        )
+        cls.in_text = Post.objects.create(
+            text='Кактусы цветут раз в году', author=cls.author
+        )
+        cls.in_group = Post.objects.create(
+            text='Про кактусы', author=cls.author, group=cls.group
+        )
+        cls.other = Post.objects.create(
+            text='Совсем другой пост', author=cls.author
+        )
+
+    def search(self, query):
+        response = self.client.get(reverse('search'), {'q': query})
+        return list(response.context['page'])
+
+    def test_search_finds_by_text_and_group(self):
+        """Поиск идёт по тексту поста и названию сообщества"""
+        self.assertCountEqual(
+            self.search('кактус'), [self.in_text, self.in_group]
+        )
+        self.assertEqual(self.search('ботаника'), [self.in_group])
+        self.assertEqual(self.search('"кактусы*'), self.search('кактусы'))
+        self.assertEqual(self.search('жирафы'), [])
+
+    def test_search_ranks_results(self):
+        """Совпадение в коротком тексте и в сообществе выше остальных"""
+        self.assertEqual(
+            self.search('кактусы ботаника'), [self.in_group]
+        )
+        self.assertEqual(self.search('кактусы')[0], self.in_group)
+
+    def test_index_follows_model_changes(self):
+        """Индекс обновляется при правке и удалении постов и сообществ"""
+        self.in_text.text = 'Жирафы'
+        self.in_text.save()
+        self.assertEqual(self.search('жирафы'), [self.in_text])
+        self.group.title = 'Садоводство'
+        self.group.save()
+        self.assertEqual(self.search('садоводство'), [self.in_group])
+        self.group.delete()
+        self.assertEqual(self.search('садоводство'), [])
+        self.other.delete()
+        self.assertEqual(self.search('другой'), [])
+
+    def test_index_post_does_not_load_group(self):
+        """Название сообщества берётся подзапросом, без post.group"""
+        post = Post.objects.get(pk=self.in_group.pk)
+        with self.assertNumQueries(2):
+            search.index_post(post)
+        self.assertEqual(self.search('ботаника'), [self.in_group])
+
+    def test_unindexed_database_warns(self):
+        with mock.patch('posts.search.index_enabled', return_value=False), \
+                mock.patch('posts.search._warned', False), \
+                self.assertLogs('posts.search', 'WARNING'):
+            self.assertEqual(
+                list(search.find_posts('кактусы ботаника')), []
+            )
+
+    def test_search_pages_keep_query(self):
+        """Ссылки паджинатора сохраняют поисковый запрос"""
+        for i in range(settings.POSTS_PER_PAGE):
+            Post.objects.create(text=f'Кактус {i}', author=self.author)
+        response = self.client.get(reverse('search'), {'q': 'кактус'})
+        self.assertContains(
+            response, '?q=%D0%BA%D0%B0%D0%BA%D1%82%D1%83%D1%81&amp;page=2'
+        )
+        response = self.client.get(
+            reverse('search'), {'q': 'кактус', 'page': 2}
+        )
+        self.assertEqual(len(response.context['page']), 2)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке постов идёт по индексу"""
+        admin = USER.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'ботаника'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.in_group]
+        )
+
+
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = USER.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        cls.url = reverse(
+            'post', kwargs={'username': 'author', 'post_id': cls.post.id}
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def add_comments(self, count):
+        for _ in range(count):
+            Comment.objects.create(
+                text='Комментарий', author=self.author, post=self.post
+            )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        return response, len(context)
+
+    def test_first_screen_is_bounded(self):
+        """Число запросов и комментариев на странице поста не растёт"""
+        self.add_comments(1)
+        lookups.get_author_or_404('author')
+        _, few = self.count_queries()
+        self.add_comments(settings.COMMENTS_PER_PAGE * 2)
+        response, many = self.count_queries()
+        self.assertEqual(many, few)
+        self.assertEqual(
+            len(response.context['comments']), settings.COMMENTS_PER_PAGE
+        )
+        self.assertIsNotNone(response.context['comments_next'])
+
+    def test_load_more_walks_all_comments(self):
+        """Курсор проходит все комментарии по одному разу, старые первыми"""
+        self.add_comments(settings.COMMENTS_PER_PAGE * 2 + 5)
+        response = self.client.get(self.url)
+        seen = [comment.id for comment in response.context['comments']]
+        cursor = response.context['comments_next']
+        while cursor:
+            response = self.client.get(reverse('post_comments', kwargs={
+                'username': 'author', 'post_id': self.post.id
+            }), {'after': cursor, 'fragment': 1})
+            self.assertTemplateNotUsed(response, 'base.html')
+            seen += [comment.id for comment in response.context['comments']]
+            cursor = response.context['comments_next']
+        self.assertEqual(seen, list(self.post.comments.order_by(
+            'created', 'id'
+        ).values_list('id', flat=True)))
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = USER.objects.create_user(username='author')
+        self.group = Group.objects.create(title='Сообщество', slug='group')
+        self.older = Post.objects.create(
+            text='Старый пост', author=self.author, group=self.group
+        )
+        self.newer = Post.objects.create(
+            text='Новый пост', author=self.author
+        )
+
+    def ranking(self, url):
+        return list(self.client.get(url).context['page'])
+
+    def test_comments_raise_post(self):
+        """Обсуждаемый пост обгоняет более новый"""
+        popular = reverse('popular')
+        self.assertEqual(self.ranking(popular), [self.newer, self.older])
+        Comment.objects.create(
+            text='Комментарий', author=self.author, post=self.older
+        )
+        self.assertEqual(self.ranking(popular), [self.older, self.newer])
+        self.assertEqual(self.ranking(
+            reverse('group_trending', kwargs={'slug': 'group'})
+        ), [self.older])
+
+    def test_refresh_matches_incremental_scores(self):
+        for _ in range(3):
+            Comment.objects.create(
+                text='Комментарий', author=self.author, post=self.newer
+            )
+        incremental = dict(PostScore.objects.values_list('post', 'score'))
+        trending.refresh()
+        refreshed = dict(PostScore.objects.values_list('post', 'score'))
+        self.assertEqual(incremental.keys(), refreshed.keys())
+        for post, score in incremental.items():
+            self.assertAlmostEqual(score, refreshed[post])
+
+    def test_refresh_drops_inactive_posts(self):
+        Post.objects.filter(pk=self.older.pk).update(
+            pub_date=self.older.pub_date - timedelta(
+                seconds=settings.TRENDING_WINDOW + 1
+            )
+        )
+        trending.refresh()
+        self.assertEqual(self.ranking(reverse('popular')), [self.newer])
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = USER.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_unchanged_page_returns_not_modified(self):
+        """Неизменившаяся страница отдаёт 304, изменившаяся — 200"""
+        url = reverse('post', kwargs={
+            'username': 'author', 'post_id': self.post.id
+        })
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            text='Комментарий', author=self.author, post=self.post
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_edited_feed_is_modified_since(self):
+        """Правка поста меняет Last-Modified ленты, хотя pub_date прежний"""
+        url = reverse('index')
+        # Last-Modified точен до секунды: прошлое изменение раньше
+        cache.set_many({
+            SCOPE_KEY % scope: time.time() - 10 for scope in ('all', 'index')
+        }, None)
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.post.text = 'Исправленный текст'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], last_modified)
+
+    def test_unrelated_writes_keep_validators(self):
+        """Комментарий к посту не меняет ETag страниц других областей"""
+        group = Group.objects.create(title='Группа', slug='group')
+        other = USER.objects.create_user(username='other')
+        Post.objects.create(text='Пост в группе', author=other, group=group)
+        urls = {
+            'group': reverse('group', kwargs={'slug': 'group'}),
+            'profile': reverse('profile', kwargs={'username': 'other'}),
+            'index': reverse('index'),
+        }
+        etags = {name: self.client.get(url)['ETag']
+                 for name, url in urls.items()}
+        Comment.objects.create(
+            text='Комментарий', author=self.author, post=self.post
+        )
+        for name in ('group', 'profile'):
+            with self.subTest(name=name):
+                response = self.client.get(
+                    urls[name], HTTP_IF_NONE_MATCH=etags[name]
+                )
+                self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            urls['index'], HTTP_IF_NONE_MATCH=etags['index']
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_moved_post_changes_both_groups(self):
+        """Перенос поста меняет страницы прежнего и нового сообщества"""
+        old = Group.objects.create(title='Старая', slug='old')
+        new = Group.objects.create(title='Новая', slug='new')
+        post = Post.objects.create(text='Пост', author=self.author, group=old)
+        urls = [reverse('group', kwargs={'slug': slug})
+                for slug in ('old', 'new')]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        post = Post.objects.get(pk=post.pk)
+        post.group = new
+        post.save()
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_pages_vary_by_viewer(self):
+        """Страница вошедшего пользователя своя и хранится только у него"""
+        url = reverse('index')
+        guest = self.client.get(url)
+        author = self.author_client.get(url)
+        self.assertNotEqual(guest['ETag'], author['ETag'])
+        self.assertIn('Cookie', author['Vary'])
+        self.assertIn('private', author['Cache-Control'])
+        self.assertNotIn('private', guest['Cache-Control'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=author['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = USER.objects.create_user(username='author')
+        Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        profiling.samples.clear()
+
+    def test_sampling_off_adds_nothing(self):
+        """Без выборки заголовка и записей в буфере нет"""
+        response = Client().get(reverse('index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(profiling.recent(), [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_request_profile_is_recorded(self):
+        """Запрос в выборке попадает в буфер, Server-Timing — сотрудникам"""
+        client = Client()
+        client.force_login(USER.objects.create_user('staff', is_staff=True))
+        response = client.get(reverse('index'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('cache-feed;desc="hit 0, miss 1"',
+                      response['Server-Timing'])
+        client.get(reverse('index'))
+        latest, first = profiling.recent()
+        self.assertEqual(first['path'], reverse('index'))
+        self.assertEqual(first['templates']['post_item.html']['count'], 1)
+        self.assertIn('context_processors', first['sections'])
+        self.assertGreater(first['queries'], 0)
+        self.assertEqual(latest['cache']['feed'], {'hits': 1, 'misses': 0})
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_server_timing_is_hidden_from_visitors(self):
+        """Посетитель в выборке не получает Server-Timing"""
+        response = Client().get(reverse('index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(len(profiling.recent()), 1)
+        with self.settings(PROFILING_SERVER_TIMING=True):
+            response = Client().get(reverse('index'))
+        self.assertTrue(response.has_header('Server-Timing'))
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_admin_page_shows_samples(self):
+        """Страница админки показывает последние профили"""
+        admin = USER.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        client = Client()
+        client.force_login(admin)
+        client.get(reverse('group', kwargs={'slug': 'missing'}))
+        response = client.get(reverse('profiling_report'))
+        self.assertContains(response, 'GET /group/missing/')
+        self.assertEqual(
+            Client().get(reverse('profiling_report')).status_code, 302
+        )
@@ -0,0 +1,269 @@
+"""
+Предварительная генерация миниатюр картинок постов.
+
+Миниатюры всех размеров из POST_THUMBNAIL_SIZES создаются после
+сохранения PostForm в пуле фоновых потоков, а шаблоны только читают
+готовые миниатюры из хранилища ключей sorl-thumbnail и никогда не
+ждут изменения размера картинки. Миниатюры карточек страницы читаются
+вместе (attach_thumbnails): одним get_many из кэша и одним запросом
+к базе для промахов. Пока миниатюры нет, карточка показывает оригинал
+и не кэшируется ни сама, ни во фрагменте ленты, а картинка ставится в
+очередь (enqueue_missing). После генерации у постов с картинкой
+меняется updated_at, то есть версия их карточек. Картинка, миниатюры
+которой создать не удалось, не ставится в очередь снова в течение
+THUMBNAIL_RETRY_TIMEOUT.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import profiling
+from .cache import invalidate_scopes
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Картинки, миниатюры которых уже стоят в очереди
+_pending = set()
+FAILED_KEY = 'thumbnail_failed:%s'
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """
+        Файл миниатюры без обращения к хранилищу ключей.
+        Опции дополняются так же, как в get_thumbnail, чтобы имя
+        миниатюры совпадало с тем, что создаёт генерация.
+        """
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра из хранилища ключей или None"""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+
+
+backend = PostThumbnailBackend()
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+def thumbnail_size(size):
+    """Геометрия и опции миниатюры по её имени в POST_THUMBNAIL_SIZES"""
+    geometry, options = settings.POST_THUMBNAIL_SIZES[size]
+    return geometry, dict(options)
+
+
+def _get_many(keys):
+    """
+    Записи хранилища ключей sorl-thumbnail по ключам keys: одним
+    get_many из кэша и одним запросом к базе для промахов. Другие
+    хранилища читаются по одному ключу
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        found = {key: kvstore._get(key) for key in keys}
+        return {key: value for key, value in found.items() if value}
+    raw_keys = {add_prefix(key): key for key in keys}
+    values = kvstore.cache.get_many(list(raw_keys))
+    missing = [raw_key for raw_key in raw_keys if raw_key not in values]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing
+        ).values_list('key', 'value'))
+        # Отсутствие тоже кэшируется, как в KVStore._get_raw
+        kvstore.cache.set_many({
+            raw_key: stored.get(raw_key, EMPTY_VALUE) for raw_key in missing
+        }, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(stored)
+    return {
+        raw_keys[raw_key]: deserialize_image_file(value)
+        for raw_key, value in values.items()
+        if value and value != EMPTY_VALUE
+    }
+
+
+def cached_thumbnails(images, size):
+    """
+    Готовые миниатюры размера size для картинок images (None, если
+    картинки или миниатюры нет) одним чтением хранилища ключей,
+    без генерации
+    """
+    geometry, options = thumbnail_size(size)
+    with profiling.section('thumbnails'):
+        targets = [
+            backend.thumbnail_file(image, geometry, **options)
+            if image else None
+            for image in images
+        ]
+        found = _get_many({
+            target.key for target in targets if target is not None
+        })
+    thumbnails = []
+    for target in targets:
+        thumbnail = None
+        if target is not None:
+            thumbnail = found.get(target.key)
+            profiling.record_cache('thumbnail', thumbnail is not None)
+        thumbnails.append(thumbnail)
+    return thumbnails
+
+
+def cached_thumbnail(image, size):
+    """Готовая миниатюра размера size или None, без генерации"""
+    return cached_thumbnails([image], size)[0]
+
+
+def attach_thumbnails(posts, size):
+    """
+    Добавляет постам атрибут <size>_thumbnail с готовой миниатюрой
+    картинки или None
+    """
+    posts = list(posts)
+    found = cached_thumbnails([post.image for post in posts], size)
+    for post, thumbnail in zip(posts, found):
+        setattr(post, '%s_thumbnail' % size, thumbnail)
+
+
+def generate(image):
+    """Создаёт миниатюры всех настроенных размеров картинки"""
+    for size in settings.POST_THUMBNAIL_SIZES:
+        geometry, options = thumbnail_size(size)
+        backend.get_thumbnail(image, geometry, **options)
+
+
+def refresh(name):
+    """
+    Создаёт недостающие миниатюры картинки name и меняет версию
+    карточек постов с ней: вместо оригинала они покажут миниатюру.
+    Если все миниатюры уже есть, карточки не меняются
+    """
+    created = False
+    for size in settings.POST_THUMBNAIL_SIZES:
+        geometry, options = thumbnail_size(size)
+        if backend.get_cached_thumbnail(name, geometry, **options) is None:
+            backend.get_thumbnail(name, geometry, **options)
+            # Нечитаемую картинку sorl-thumbnail только пишет в журнал
+            if backend.get_cached_thumbnail(
+                    name, geometry, **options) is None:
+                raise ThumbnailError(f'Миниатюра {size} для {name} не создана')
+            created = True
+    if not created:
+        return
+    posts = Post.objects.filter(image=name)
+    posts.update(updated_at=timezone.now())
+    # Страницы самих постов; ленты с оригиналом не кэшировались
+    invalidate_scopes(*(
+        f'post:{pk}' for pk in posts.values_list('pk', flat=True)
+    ))
+
+
+def _failed_key(name):
+    return FAILED_KEY % hashlib.md5(name.encode()).hexdigest()
+
+
+def mark_failed(name):
+    """Картинка name не ставится в очередь до THUMBNAIL_RETRY_TIMEOUT"""
+    cache.set(_failed_key(name), True, settings.THUMBNAIL_RETRY_TIMEOUT)
+
+
+def failed_images(names):
+    """Картинки из names, миниатюры которых недавно не удалось создать"""
+    keys = {_failed_key(name): name for name in names}
+    return {keys[key] for key in cache.get_many(list(keys))}
+
+
+def _run(name):
+    try:
+        refresh(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        mark_failed(name)
+    finally:
+        _pending.discard(name)
+        # У каждого потока пула своё соединение с базой
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def enqueue(name):
+    """Ставит генерацию миниатюр картинки в очередь"""
+    if settings.THUMBNAIL_QUEUE_BACKEND == 'sync':
+        refresh(name)
+        return
+    if name in _pending:
+        return
+    _pending.add(name)
+    _get_executor().submit(_run, name)
+
+
+def schedule(post):
+    """Генерирует миниатюры поста после фиксации транзакции"""
+    if post.image:
+        name = post.image.name
+        transaction.on_commit(lambda: enqueue(name))
+
+
+def enqueue_missing(posts, size):
+    """
+    Ставит в очередь картинки постов, у которых нет миниатюры size
+    (attach_thumbnails): посты, загруженные до появления миниатюр или
+    архивом, получают их с первым показом, а не после
+    generate_thumbnails. В режиме 'sync' миниатюры создаются при
+    сохранении поста, и показ их не создаёт.
+
+    Возвращает картинки, миниатюры которых недавно не удалось создать:
+    они в очередь не ставятся
+    """
+    names = {
+        post.image.name for post in posts
+        if post.image and getattr(post, '%s_thumbnail' % size) is None
+    }
+    if not names:
+        return set()
+    failed = failed_images(names)
+    if settings.THUMBNAIL_QUEUE_BACKEND != 'sync':
+        for name in names - failed:
+            enqueue(name)
+    return failed
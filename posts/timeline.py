@@ -0,0 +1,164 @@
+"""
+Материализованная лента подписок (fan-out on write).
+
+Новый пост раскладывается в TimelineEntry каждого подписчика автора,
+и лента подписок читается одним проходом по индексу
+(user, pub_date) без соединения с Follow. Посты авторов с очень
+большим числом подписчиков не раскладываются: они подмешиваются
+при чтении (fan-out on read). Когда автор перестаёт быть популярным,
+все его посты раскладываются по лентам подписчиков
+(followers_changed), иначе посты, написанные за время популярности,
+пропали бы из лент. Новый подписчик получает в ленту все посты автора
+(backfill).
+"""
+from django.conf import settings
+from django.db.models import F, Q
+
+from .bulk import batches
+from .models import Follow, Post, TimelineEntry, UserStats
+
+BATCH_SIZE = 1000
+
+
+def timeline_enabled():
+    return settings.FOLLOW_TIMELINE_ENABLED
+
+
+def is_popular(author_id):
+    """Посты автора читаются напрямую, а не раскладываются по лентам"""
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.FOLLOW_TIMELINE_FANOUT_LIMIT
+    ).exists()
+
+
+def _insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты подписчиков его автора"""
+    if not timeline_enabled() or is_popular(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        batch.append(TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        ))
+        if len(batch) == BATCH_SIZE:
+            _insert(batch)
+            batch = []
+    _insert(batch)
+
+
+def _posts_of(author_id):
+    """(id, pub_date) всех постов автора списками по BATCH_SIZE"""
+    posts = Post.objects.filter(author_id=author_id).order_by().values_list(
+        'id', 'pub_date'
+    )
+    return batches(posts.iterator(chunk_size=BATCH_SIZE), BATCH_SIZE)
+
+
+def backfill(user, author):
+    """
+    Добавляет в ленту нового подписчика все посты автора пачками:
+    лента подписок читается только из TimelineEntry, и старые посты
+    иначе пропали бы с дальних страниц
+    """
+    if not timeline_enabled() or is_popular(author.pk):
+        return
+    for posts in _posts_of(author.pk):
+        _insert([
+            TimelineEntry(
+                user_id=user.pk,
+                post_id=post_id,
+                author_id=author.pk,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts
+        ])
+
+
+def followers_changed(author_id):
+    """
+    Вызывается после отписки от автора. Если число подписчиков только
+    что опустилось до FOLLOW_TIMELINE_FANOUT_LIMIT, лента больше не
+    подмешивает посты автора при чтении, и все его посты
+    раскладываются по лентам подписчиков
+    """
+    if not timeline_enabled():
+        return
+    count = UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if count != settings.FOLLOW_TIMELINE_FANOUT_LIMIT:
+        return
+    # Подписчиков не больше FOLLOW_TIMELINE_FANOUT_LIMIT
+    followers = list(Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True))
+    for posts in _posts_of(author_id):
+        batch = []
+        for user_id in followers:
+            batch.extend(
+                TimelineEntry(
+                    user_id=user_id,
+                    post_id=post_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for post_id, pub_date in posts
+            )
+            if len(batch) >= BATCH_SIZE:
+                _insert(batch)
+                batch = []
+        _insert(batch)
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора, от которого пользователь отписался"""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(users=None):
+    """Заново собирает ленты пользователей из подписок"""
+    follows = Follow.objects.select_related('user', 'author')
+    if users is not None:
+        follows = follows.filter(user__in=users)
+        TimelineEntry.objects.filter(user__in=users).delete()
+    else:
+        TimelineEntry.objects.all().delete()
+    for follow in follows.iterator(chunk_size=BATCH_SIZE):
+        backfill(follow.user, follow.author)
+
+
+def follow_feed(user):
+    """Посты ленты подписок пользователя"""
+    posts = Post.objects.for_feed()
+    if not timeline_enabled():
+        return posts.filter(author__following__user=user)
+    popular = Follow.objects.filter(
+        user=user,
+        author__stats__followers_count__gt=(
+            settings.FOLLOW_TIMELINE_FANOUT_LIMIT
+        )
+    ).values_list('author_id', flat=True)
+    if not popular.exists():
+        # Сортировка по полям TimelineEntry позволяет читать страницу
+        # прямо из индекса (user, pub_date, post) без сортировки
+        return posts.filter(timeline_entries__user=user).annotate(
+            timeline_pub_date=F('timeline_entries__pub_date'),
+            timeline_post=F('timeline_entries__post'),
+        ).order_by('-timeline_pub_date', '-timeline_post')
+    materialized = TimelineEntry.objects.filter(
+        user=user
+    ).values_list('post_id', flat=True)
+    return posts.filter(Q(id__in=materialized) | Q(author__in=popular))
@@ -0,0 +1,134 @@
+"""
+Ленты «Популярное» и «Обсуждаемое в сообществе».
+
+Вклад события (публикация поста или комментарий) в рейтинг поста
+затухает вдвое каждые TRENDING_HALF_LIFE секунд. Рейтинг хранится в
+PostScore логарифмом суммы вкладов, отсчитанных от постоянной эпохи:
+
+    score = ln(sum(weight * exp((t - EPOCH) / tau)))
+
+Затухание одинаково для всех постов и не меняет их порядка, поэтому
+score не нужно пересчитывать со временем: новый комментарий
+добавляет свой вклад одним UPDATE (add_comment), а лента читается по
+индексу (score, post) страницами по курсору.
+
+Команда refresh_trending пересчитывает рейтинги по комментариям за
+TRENDING_WINDOW и удаляет посты без активности за это время, так что
+таблица остаётся небольшой. Удалённые комментарии учитываются только
+при таком пересчёте.
+"""
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, F, FloatField, Q, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from .models import Comment, Post, PostScore
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+BATCH_SIZE = 1000
+
+
+def event_score(moment, weight=1.0):
+    """Вклад события в момент moment в логарифмической шкале"""
+    tau = settings.TRENDING_HALF_LIFE / math.log(2)
+    return (moment - EPOCH).total_seconds() / tau + math.log(weight)
+
+
+def _add(score, other):
+    """ln(exp(score) + exp(other)) без переполнения"""
+    return max(score, other) + math.log1p(math.exp(-abs(score - other)))
+
+
+def add_post(post):
+    """Новый пост попадает в ленты с вкладом своей публикации"""
+    PostScore.objects.get_or_create(post=post, defaults={
+        'group_id': post.group_id,
+        'score': event_score(post.pub_date, settings.TRENDING_POST_WEIGHT),
+        'last_activity': post.pub_date,
+    })
+
+
+def move_post(post):
+    """Пост перенесён в другое сообщество"""
+    PostScore.objects.filter(post=post).exclude(
+        group_id=post.group_id
+    ).update(group_id=post.group_id)
+
+
+def add_comment(comment):
+    """Добавляет вклад нового комментария к рейтингу его поста"""
+    score = Value(event_score(comment.created), output_field=FloatField())
+    updated = PostScore.objects.filter(post_id=comment.post_id).update(
+        score=Greatest(F('score'), score) + Ln(
+            Value(1.0) + Exp(-Abs(F('score') - score))
+        ),
+        last_activity=Greatest(F('last_activity'), Value(
+            comment.created, output_field=DateTimeField()
+        )),
+    )
+    if not updated:
+        # Пост выпал из таблицы при пересчёте и снова обсуждается
+        refresh(Post.objects.filter(pk=comment.post_id))
+
+
+def compute(posts, since):
+    """Рейтинги posts по их публикации и комментариям после since"""
+    weight = settings.TRENDING_POST_WEIGHT
+    scores = {
+        pk: [group_id, event_score(pub_date, weight), pub_date]
+        for pk, group_id, pub_date in posts.values_list(
+            'pk', 'group_id', 'pub_date'
+        ).iterator(chunk_size=BATCH_SIZE)
+    }
+    comments = Comment.objects.filter(
+        post__in=posts.values('pk'), created__gte=since
+    ).order_by().values_list('post_id', 'created')
+    for post_id, created in comments.iterator(chunk_size=BATCH_SIZE):
+        entry = scores[post_id]
+        entry[1] = _add(entry[1], event_score(created))
+        entry[2] = max(entry[2], created)
+    return [
+        PostScore(
+            post_id=pk, group_id=group_id, score=score,
+            last_activity=last_activity
+        )
+        for pk, (group_id, score, last_activity) in scores.items()
+    ]
+
+
+def refresh(posts=None):
+    """
+    Пересчитывает рейтинги постов posts (по умолчанию всех), у которых
+    была активность за TRENDING_WINDOW; рейтинги остальных из них
+    удаляются. Возвращает число рейтингов
+    """
+    since = timezone.now() - timedelta(seconds=settings.TRENDING_WINDOW)
+    if posts is None:
+        posts = Post.objects.all()
+        stale = PostScore.objects.all()
+    else:
+        stale = PostScore.objects.filter(post__in=posts.values('pk'))
+    active = posts.filter(
+        Q(pub_date__gte=since) | Q(comments__created__gte=since)
+    ).distinct()
+    scores = compute(active.order_by(), since)
+    with transaction.atomic():
+        stale.delete()
+        PostScore.objects.bulk_create(
+            scores, batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+    return len(scores)
+
+
+def ranked(group=None):
+    """Посты по убыванию рейтинга, для CursorPaginator"""
+    posts = Post.objects.for_feed().filter(trending__isnull=False)
+    if group is not None:
+        posts = posts.filter(trending__group=group)
+    return posts.annotate(
+        trending_score=F('trending__score')
+    ).order_by('-trending_score', '-id')
@@ -1,10 +1,30 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group'),
+    path(
+        'group/<slug:slug>/trending/',
+        views.group_trending,
+        name='group_trending'
+    ),
+    path('popular/', views.popular, name='popular'),
     path('new/', views.new_post, name='new_post'),
+    path('search/', views.search, name='search'),
+    path('api/posts/', api.index, name='api_index'),
+    path('api/posts/<int:post_id>/', api.post_detail, name='api_post'),
+    path(
+        'api/posts/<int:post_id>/comments/',
+        api.comments,
+        name='api_comments'
+    ),
+    path('api/groups/<slug:slug>/posts/', api.group, name='api_group'),
+    path(
+        'api/users/<str:username>/posts/',
+        api.profile,
+        name='api_profile'
+    ),
     path(
         "follow/",
         views.follow_index,
@@ -15,6 +35,11 @@ urlpatterns = [
         views.post_view,
         name='post'
     ),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         '<str:username>/<int:post_id>/edit/',
         views.post_edit,
@@ -1,37 +1,188 @@
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import redirect, render, get_object_or_404
-from .models import Post, Group, Follow
+from . import profiling, thumbnails, timeline, trending
+from .cache import feed_cache_key, feed_cache_stats
+from .conditional import conditional_page
+from .lookups import get_author_or_404, get_group_or_404
+from .models import Post, Follow, UserStats
 from .forms import PostForm, CommentForm
+from .feed_counts import feed_count
+from .paginators import COMMENTS_ORDERING, CursorPaginator, FeedPaginator
+from .search import find_posts
 
 
-User = get_user_model()
+def paginate(request, posts, feed, count=None):
+    """
+    Возвращает страницу ленты: по курсору для лент из
+    CURSOR_PAGINATED_FEEDS, иначе по номеру страницы. count — число
+    постов ленты или функция, которая его вернёт (FeedPaginator)
+    """
+    if feed in settings.CURSOR_PAGINATED_FEEDS:
+        paginator = CursorPaginator(posts, settings.POSTS_PER_PAGE)
+        return paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before')
+        )
+    paginator = FeedPaginator(posts, settings.POSTS_PER_PAGE, count=count)
+    return paginator.get_page(request.GET.get('page'))
+
+
+def wants_fragment(request):
+    """Запрос следующих карточек ленты без страницы (load_more.html)"""
+    return 'fragment' in request.GET
+
+
+def render_fragment(request, page, feed_key):
+    """
+    Только карточки постов страницы и ссылка «Показать ещё»; адрес
+    следующей порции дублируется в заголовке Link
+    """
+    response = render(request, 'feed_fragment.html', {
+        'page': page,
+        'feed_key': feed_key
+    })
+    if page.has_next():
+        params = request.GET.copy()
+        for name in ('page', 'after', 'before'):
+            params.pop(name, None)
+        if getattr(page, 'is_cursor', False):
+            params['after'] = page.next_cursor
+        else:
+            params['page'] = page.next_page_number()
+        response['Link'] = '<%s?%s>; rel="next"' % (
+            request.path, params.urlencode()
+        )
+    return response
+
+
+def index_scopes(request):
+    return ('index',)
+
+
+def group_scopes(request, slug):
+    return (f'group:{get_group_or_404(slug).id}',)
+
+
+def trending_scopes(request, slug=None):
+    if slug is None:
+        return ('index', 'trending')
+    return (*group_scopes(request, slug), 'trending')
 
 
+def profile_scopes(request, username):
+    return (f'author:{get_author_or_404(username).id}',)
+
+
+def post_page_scopes(request, username, post_id):
+    """Страница поста выводит и счётчики автора"""
+    return (f'post:{post_id}', *profile_scopes(request, username))
+
+
+def comments_scopes(request, username, post_id):
+    return (f'post:{post_id}',)
+
+
+def follow_scopes(request):
+    """Лента подписок: посты всех авторов и подписки читателя"""
+    return ('index', f'follower:{request.user.pk}')
+
+
+@conditional_page(index_scopes)
 def index(request):
     """Представление главной страницы"""
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, 'index.html', {'page': page})
+    post_list = Post.objects.for_feed()
+    page = paginate(request, post_list, 'index', count=lambda: feed_count(
+        'index', post_list, estimate=True
+    ))
+    feed_key = feed_cache_key('index', request, index_scopes(request))
+    if wants_fragment(request):
+        return render_fragment(request, page, feed_key)
+    return render(request, 'index.html', {
+        'page': page,
+        'feed_key': feed_key
+    })
 
 
+@conditional_page(group_scopes)
 def group_posts(request, slug):
     """Представление главной страницы сообщества"""
-    group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    group = get_group_or_404(slug)
+    posts = Post.objects.for_feed().filter(group=group)
+    page = paginate(request, posts, 'group', count=lambda: feed_count(
+        f'group:{group.id}', posts
+    ))
+    feed_key = feed_cache_key(
+        'group', request, group_scopes(request, slug)
+    )
+    if wants_fragment(request):
+        return render_fragment(request, page, feed_key)
     return render(
         request,
         'group.html',
-        {'group': group, 'page': page}
+        {
+            'group': group,
+            'page': page,
+            'feed_key': feed_key
+        }
+    )
+
+
+def ranked_page(request, posts):
+    """Страница ленты по рейтингу: только по курсору"""
+    paginator = CursorPaginator(posts, settings.POSTS_PER_PAGE)
+    return paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before')
     )
 
 
+@conditional_page(trending_scopes)
+def popular(request):
+    """Популярные посты всего сайта"""
+    page = ranked_page(request, trending.ranked())
+    feed_key = feed_cache_key(
+        'popular', request, trending_scopes(request)
+    )
+    if wants_fragment(request):
+        return render_fragment(request, page, feed_key)
+    return render(request, 'popular.html', {
+        'page': page,
+        'feed_key': feed_key
+    })
+
+
+@conditional_page(trending_scopes)
+def group_trending(request, slug):
+    """Обсуждаемые посты сообщества"""
+    group = get_group_or_404(slug)
+    page = ranked_page(request, trending.ranked(group))
+    feed_key = feed_cache_key(
+        'group_trending', request, trending_scopes(request, slug)
+    )
+    if wants_fragment(request):
+        return render_fragment(request, page, feed_key)
+    return render(request, 'group.html', {
+        'group': group,
+        'page': page,
+        'trending': True,
+        'feed_key': feed_key
+    })
+
+
+def search(request):
+    """Представление страницы поиска по постам"""
+    query = request.GET.get('q', '').strip()
+    results = find_posts(query) if query else Post.objects.none()
+    paginator = FeedPaginator(results, settings.POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('page'))
+    return render(request, 'search.html', {
+        'query': query,
+        'page': page
+    })
+
+
 @login_required
 def new_post(request):
     """Представление формы нового поста"""
@@ -40,6 +191,7 @@ def new_post(request):
         post = form.save(commit=False)
         post.author = request.user
         form.save()
+        thumbnails.schedule(post)
         return redirect('index')
     return render(request, 'post_form.html', {
         'form': form,
@@ -47,42 +199,93 @@ def new_post(request):
     })
 
 
+@conditional_page(profile_scopes)
 def profile(request, username):
     """Представление профайла пользователя"""
-    author = User.objects.get(username=username)
-    posts = Post.objects.filter(author=author)
+    author = get_author_or_404(username)
+    posts = Post.objects.for_feed().filter(author=author)
+    feed_key = feed_cache_key(
+        'profile', request, profile_scopes(request, username)
+    )
+    if wants_fragment(request):
+        # Карточка автора и подписка нужны только целой странице
+        return render_fragment(request, paginate(
+            request, posts, 'profile',
+            count=lambda: UserStats.for_user(author).posts_count
+        ), feed_key)
     following = request.user.is_authenticated and Follow.objects.filter(
         user=request.user,
         author=author).exists()
-    posts_quantity = posts.count()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    stats = UserStats.for_user(author)
+    posts_quantity = stats.posts_count
+    page = paginate(request, posts, 'profile', count=posts_quantity)
     return render(request, 'profile.html', {
         'author': author,
+        'stats': stats,
         'page': page,
         'posts_quantity': posts_quantity,
-        'following': following
+        'following': following,
+        'feed_key': feed_key
     })
 
 
+@conditional_page(post_page_scopes)
 def post_view(request, username, post_id):
     """Представление страницы отдельного поста"""
-    author = User.objects.get(username=username)
+    author = get_author_or_404(username)
     form = CommentForm()
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
-    posts_quantity = Post.objects.filter(author=author).count()
+    post = get_object_or_404(Post.objects.for_feed(), id=post_id)
+    # Первый экран комментариев ограничен, остальные подгружаются
+    # по курсору (post_comments). Вычисление queryset заполняет его
+    # кэш, и шаблон не повторяет запрос
+    comments = post.comments.select_related('author').order_by(
+        *COMMENTS_ORDERING
+    )[:settings.COMMENTS_PER_PAGE]
+    shown = list(comments)
+    comments_next = None
+    if shown and post.comments_count > len(shown):
+        comments_next = comments_paginator(post).encode_cursor(shown[-1])
+    stats = UserStats.for_user(author)
+    posts_quantity = stats.posts_count
     context = {
         'post': post,
         'author': author,
+        'stats': stats,
         'comments': comments,
+        'comments_next': comments_next,
         'posts_quantity': posts_quantity,
         'form': form
     }
     return render(request, 'post.html', context)
 
 
+def comments_paginator(post):
+    return CursorPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        ordering=COMMENTS_ORDERING
+    )
+
+
+@conditional_page(comments_scopes)
+def post_comments(request, username, post_id):
+    """Следующие комментарии поста после курсора ?after="""
+    post = get_object_or_404(
+        Post.objects.select_related('author'), id=post_id
+    )
+    page = comments_paginator(post).get_page(after=request.GET.get('after'))
+    return render(
+        request,
+        'comment_list.html' if wants_fragment(request)
+        else 'post_comments.html',
+        {
+            'post': post,
+            'comments': page,
+            'comments_next': page.next_cursor,
+        }
+    )
+
+
 @login_required
 def post_edit(request, username, post_id):
     """Представление формы редактирования поста"""
@@ -99,6 +302,8 @@ def post_edit(request, username, post_id):
         )
         if form.is_valid():
             form.save()
+            if 'image' in form.changed_data:
+                thumbnails.schedule(post)
             return redirect('post', username, post_id)
 
     return render(request, 'post_form.html', {
@@ -136,23 +341,41 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
+@staff_member_required
+def profiling_report(request):
+    """Страница админки с последними профилями запросов"""
+    return render(request, 'admin/profiling.html', {
+        'title': 'Профилирование запросов',
+        'samples': profiling.recent(),
+        'sample_rate': settings.PROFILING_SAMPLE_RATE,
+        'feed_cache': feed_cache_stats(),
+    })
+
+
 @login_required
+@conditional_page(follow_scopes)
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = timeline.follow_feed(request.user)
+    page = paginate(request, posts, 'follow_index', count=lambda: feed_count(
+        f'follow:{request.user.pk}', posts
+    ))
+    feed_key = feed_cache_key(
+        'follow_index', request, follow_scopes(request)
+    )
+    if wants_fragment(request):
+        return render_fragment(request, page, feed_key)
     context = {
         "page": page,
-        "paginator": paginator,
+        "paginator": page.paginator,
         "posts": posts,
+        "feed_key": feed_key,
     }
     return render(request, "follow.html", context)
 
 
 @login_required
 def profile_follow(request, username):
-    user_to_follow = get_object_or_404(User, username=username)
+    user_to_follow = get_author_or_404(username)
     if request.user != user_to_follow:
         Follow.objects.get_or_create(user=request.user, author=user_to_follow)
     return redirect("profile", username=username)
@@ -160,7 +383,7 @@ def profile_follow(request, username):
 
 @login_required
 def profile_unfollow(request, username):
-    user_to_unfollow = get_object_or_404(User, username=username)
+    user_to_unfollow = get_author_or_404(username)
     get_object_or_404(
         Follow,
         user=request.user,
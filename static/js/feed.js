@@ -0,0 +1,36 @@
+// «Показать ещё»: следующие карточки ленты загружаются с ?fragment=1
+// и вставляются на место ссылки. Без JavaScript ссылка ведёт на
+// следующую страницу целиком.
+document.addEventListener('click', function (event) {
+  var link = event.target.closest('[data-load-more]');
+  if (!link || event.ctrlKey || event.metaKey || event.shiftKey) {
+    return;
+  }
+  event.preventDefault();
+  if (link.classList.contains('disabled')) {
+    return;
+  }
+  link.classList.add('disabled');
+  var url = new URL(link.href, window.location.href);
+  url.searchParams.set('fragment', '1');
+  fetch(url, {credentials: 'same-origin'})
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.status);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      var block = link.closest('.load-more');
+      block.insertAdjacentHTML('beforebegin', html);
+      block.remove();
+      // Номера страниц после подгрузки уже не соответствуют ленте
+      document.querySelectorAll('.pagination').forEach(function (nav) {
+        nav.parentNode.removeChild(nav);
+      });
+    })
+    .catch(function () {
+      // Не вышло — переходим на следующую страницу обычным способом
+      window.location.href = link.href;
+    });
+});
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class YatubeConfig(AppConfig):
+    name = 'yatube'
+    verbose_name = 'Проект'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .db import configure_sqlite
+        connection_created.connect(
+            configure_sqlite, dispatch_uid='yatube.db.configure_sqlite'
+        )
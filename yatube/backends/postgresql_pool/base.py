@@ -0,0 +1,92 @@
+"""
+PostgreSQL с пулом соединений в процессе.
+
+Django открывает соединение на каждый запрос (или держит одно на
+поток при CONN_MAX_AGE). Здесь соединения берутся из
+psycopg2.pool.ThreadedConnectionPool и возвращаются в него при
+закрытии, поэтому запрос не тратит время на установку соединения,
+а их число ограничено POOL['max_size']. Когда все соединения заняты,
+запрос ждёт освободившееся до POOL['timeout'] секунд.
+
+Соединение из пула проходит ту же настройку, что и в стандартном
+бэкенде: get_new_connection родителя получает его вместо
+psycopg2.connect через connection_factory.
+"""
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import pool
+
+from yatube.db import DEFAULT_POOL_TIMEOUT
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class BlockingConnectionPool(pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool, который при исчерпании ждёт свободное
+    соединение timeout секунд, а не сразу падает с PoolError
+    """
+
+    def __init__(self, minconn, maxconn, timeout, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise pool.PoolError(
+                f'Нет свободного соединения в пуле за {self.timeout} с'
+            )
+        try:
+            return super().getconn(key)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+def get_pool(alias, settings_dict, conn_params):
+    # База в ключе: служебные соединения (создание тестовой базы)
+    # подключаются к другой базе под тем же псевдонимом
+    key = (alias, conn_params.get('database'))
+    with _pools_lock:
+        if key not in _pools:
+            sizes = settings_dict.get('POOL', {})
+            _pools[key] = BlockingConnectionPool(
+                sizes.get('min_size', 1),
+                sizes.get('max_size', 10),
+                sizes.get('timeout', DEFAULT_POOL_TIMEOUT),
+                **conn_params
+            )
+        return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.alias, self.settings_dict, conn_params)
+
+        def pooled(dsn, *args, **kwargs):
+            # Вызывается psycopg2.connect вместо открытия соединения
+            return self.pool.getconn()
+
+        return super().get_new_connection(
+            dict(conn_params, connection_factory=pooled)
+        )
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Незавершённая транзакция откатывается в putconn,
+        # сломанное соединение закрывается, а не возвращается
+        broken = bool(self.connection.closed) or (
+            self.errors_occurred and not self.is_usable()
+        )
+        with self.wrap_database_errors:
+            self.pool.putconn(self.connection, close=broken)
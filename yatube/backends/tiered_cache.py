@@ -0,0 +1,239 @@
+"""
+Двухуровневый кэш: маленький LRU в памяти процесса перед общим кэшем.
+
+В CACHES задаётся так:
+
+    'default': {
+        'BACKEND': 'yatube.backends.tiered_cache.TieredCache',
+        'LOCATION': 'yatube',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_PREFIXES': ('feed_fragment:',),
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 60,
+        },
+    },
+    'shared': {...},
+
+В памяти процесса хранятся только ключи с префиксами LOCAL_PREFIXES —
+версионированные, значение которых под одним ключом не меняется
+(фрагменты лент: версии лент входят в ключ). Остальные ключи, в том
+числе сами версии и счётчики, читаются и пишутся только в общем кэше,
+поэтому смена версии в одном процессе сразу видна всем остальным, а
+старые фрагменты в памяти процессов просто перестают запрашиваться.
+LOCAL_TIMEOUT ограничивает, сколько запись живёт в памяти процесса.
+
+Ключи общего кэша формирует он сам (KEY_PREFIX, VERSION), поэтому
+значения совместимы с обращением к нему напрямую.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Локальные уровни по LOCATION: как у LocMemCache, один на процесс,
+# хотя экземпляры бэкенда у каждого потока свои
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class TierStats:
+    """Попадания и промахи одного уровня"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+
+class LocalTier:
+    """LRU с ограничением числа записей и временем жизни"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = TierStats()
+        self.shared_stats = TierStats()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+            self.stats.record(entry is not None)
+        return None if entry is None else pickle.loads(entry[1])
+
+    def set(self, key, value, timeout):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, pickled)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        with _tiers_lock:
+            self.local = _tiers.setdefault(
+                location, LocalTier(options.get('LOCAL_MAX_ENTRIES', 1000))
+            )
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _is_local(self, key):
+        return key.startswith(self.local_prefixes)
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def _local_key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        local = self._is_local(key)
+        if local:
+            value = self.local.get(self._local_key(key, version))
+            if value is not None:
+                return value
+        sentinel = object()
+        value = self.shared.get(key, sentinel, version=version)
+        self.local.shared_stats.record(value is not sentinel)
+        if value is sentinel:
+            return default
+        if local and value is not None:
+            self.local.set(
+                self._local_key(key, version), value, self.local_timeout
+            )
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = None
+            if self._is_local(key):
+                value = self.local.get(self._local_key(key, version))
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            fetched = self.shared.get_many(missing, version=version)
+            for key in missing:
+                self.local.shared_stats.record(key in fetched)
+            for key, value in fetched.items():
+                if self._is_local(key) and value is not None:
+                    self.local.set(
+                        self._local_key(key, version), value,
+                        self.local_timeout
+                    )
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        if self._is_local(key):
+            self.local.set(
+                self._local_key(key, version), value,
+                self._local_timeout(timeout)
+            )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if self._is_local(key) and key not in failed:
+                self.local.set(
+                    self._local_key(key, version), value,
+                    self._local_timeout(timeout)
+                )
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added and self._is_local(key):
+            self.local.set(
+                self._local_key(key, version), value,
+                self._local_timeout(timeout)
+            )
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self._local_key(key, version))
+        self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete(self._local_key(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self.local.get(
+                self._local_key(key, version)) is not None:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Счётчики живут только в общем кэше
+        self.local.delete(self._local_key(key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def tier_stats(self):
+        """Попадания и промахи по уровням в этом процессе"""
+        local = self.local.stats.as_dict()
+        local['entries'] = len(self.local.entries)
+        return {
+            'local': local,
+            'shared': self.local.shared_stats.as_dict(),
+        }
@@ -0,0 +1,75 @@
+"""
+Настройка кэша из переменных окружения.
+
+CACHE_URL задаёт общий для всех процессов кэш адресом:
+
+    locmem://                       память процесса (по умолчанию)
+    file:///var/cache/yatube        файлы в каталоге
+    memcached://127.0.0.1:11211     memcached (нужен python-memcached)
+    redis://127.0.0.1:6379/1        Redis (нужен django-redis)
+    dummy://                        без кэша
+
+Параметры запроса timeout, max_entries и key_prefix становятся
+соответствующими настройками кэша. Перед общим кэшем стоит LRU в
+памяти процесса (yatube.backends.tiered_cache) на CACHE_LOCAL_ENTRIES
+записей; CACHE_LOCAL_ENTRIES=0 отключает его.
+"""
+import os
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+    'redis': 'django_redis.cache.RedisCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+# Ключи, которые можно держать в памяти процесса: значение под таким
+# ключом не меняется, изменения приходят с новым ключом
+LOCAL_PREFIXES = ('feed_fragment:', 'post_card:')
+LOCAL_TIMEOUT = 60
+
+
+def parse_cache_url(url):
+    """Словарь для CACHES из адреса кэша"""
+    parts = urlsplit(url)
+    if parts.scheme not in BACKENDS:
+        raise ValueError(f'Неизвестная схема кэша: {parts.scheme}')
+    options = dict(parse_qsl(parts.query))
+    config = {'BACKEND': BACKENDS[parts.scheme]}
+    if parts.scheme == 'file':
+        config['LOCATION'] = unquote(parts.path)
+    elif parts.scheme == 'redis':
+        config['LOCATION'] = url.split('?')[0]
+    elif parts.scheme in ('locmem', 'memcached'):
+        config['LOCATION'] = parts.netloc
+    if 'timeout' in options:
+        config['TIMEOUT'] = int(options.pop('timeout'))
+    if 'key_prefix' in options:
+        config['KEY_PREFIX'] = options.pop('key_prefix')
+    if 'max_entries' in options:
+        options['MAX_ENTRIES'] = int(options.pop('max_entries'))
+    config['OPTIONS'] = options
+    return config
+
+
+def caches_from_env(default_url='locmem://'):
+    """CACHES: LRU процесса перед общим кэшем из CACHE_URL"""
+    shared = parse_cache_url(os.environ.get('CACHE_URL', default_url))
+    local_entries = int(os.environ.get('CACHE_LOCAL_ENTRIES', 1000))
+    if not local_entries:
+        return {'default': shared}
+    return {
+        'default': {
+            'BACKEND': 'yatube.backends.tiered_cache.TieredCache',
+            'LOCATION': 'default',
+            'OPTIONS': {
+                'SHARED': 'shared',
+                'LOCAL_PREFIXES': LOCAL_PREFIXES,
+                'LOCAL_MAX_ENTRIES': local_entries,
+                'LOCAL_TIMEOUT': LOCAL_TIMEOUT,
+            },
+        },
+        'shared': shared,
+    }
@@ -0,0 +1,99 @@
+"""
+Чтение с реплики базы данных.
+
+ReplicaRouter отправляет чтение на реплику (REPLICA_DATABASE_ALIAS),
+а запись — на основную базу. Запрос, который что-то записал или
+пришёл не GET/HEAD, читает с основной базы до конца, а
+ReplicaStickinessMiddleware ставит пользователю cookie, по которой
+его запросы ещё REPLICA_STICKY_SECONDS читают с основной базы:
+автор видит свой пост сразу после перенаправления на главную, даже
+если реплика отстаёт.
+
+Реплика используется только в запросах, прошедших через
+ReplicaStickinessMiddleware: миграции, команды и фоновые задачи
+читают с основной базы. Без базы REPLICA_DATABASE_ALIAS в DATABASES
+всё идёт в основную.
+"""
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = threading.local()
+
+
+def _same_database(first, second):
+    keys = ('ENGINE', 'NAME', 'HOST', 'PORT')
+    return all(first.get(key) == second.get(key) for key in keys)
+
+
+def replica_alias():
+    """
+    Псевдоним реплики или None, если она не настроена или указывает
+    на саму основную базу (так реплика-зеркало выглядит в тестах)
+    """
+    alias = settings.REPLICA_DATABASE_ALIAS
+    if alias not in settings.DATABASES or _same_database(
+            connections[alias].settings_dict,
+            connections[DEFAULT_DB_ALIAS].settings_dict):
+        return None
+    return alias
+
+
+def pin_to_primary():
+    """Дальнейшее чтение в этом потоке идёт с основной базы"""
+    _state.pinned = True
+
+
+def reading_from_replica():
+    return (
+        getattr(_state, 'in_request', False)
+        and not getattr(_state, 'pinned', False)
+        and replica_alias() is not None
+    )
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return replica_alias()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Прочитать только что записанное можно лишь с основной базы
+        _state.pinned = True
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На реплике те же данные, что и в основной базе
+        return True
+
+
+class ReplicaStickinessMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = settings.REPLICA_COOKIE_NAME
+        _state.pinned = (
+            request.method not in SAFE_METHODS or cookie in request.COOKIES
+        )
+        _state.wrote = False
+        _state.in_request = True
+        try:
+            response = self.get_response(request)
+            if _state.wrote and replica_alias() is not None:
+                response.set_cookie(
+                    cookie, '1',
+                    max_age=settings.REPLICA_STICKY_SECONDS,
+                    httponly=True,
+                    samesite='Lax'
+                )
+            return response
+        finally:
+            _state.in_request = False
+            _state.pinned = False
+            _state.wrote = False
@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from yatube.caches import caches_from_env
+from yatube.db import database_from_env, parse_database_url
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -36,6 +39,7 @@ ALLOWED_HOSTS = [
 # Application definition
 
 INSTALLED_APPS = [
+    'yatube',
     'about',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -49,7 +53,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'yatube.replicas.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,13 +90,27 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# База задаётся переменной окружения DATABASE_URL (см. yatube/db.py),
+# по умолчанию — SQLite в db.sqlite3. Для PostgreSQL нужен psycopg2
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    'default': database_from_env(
+        'sqlite:///' + os.path.join(BASE_DIR, 'db.sqlite3')
+    ),
 }
 
+# Реплика для чтения (yatube/replicas.py) задаётся REPLICA_DATABASE_URL.
+# После записи пользователь ещё REPLICA_STICKY_SECONDS читает
+# с основной базы, пока реплика догоняет её. В тестах реплика — зеркало
+# основной тестовой базы
+REPLICA_DATABASE_ALIAS = 'replica'
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES[REPLICA_DATABASE_ALIAS] = dict(parse_database_url(
+        os.environ['REPLICA_DATABASE_URL']
+    ), TEST={'MIRROR': 'default'})
+DATABASE_ROUTERS = ['yatube.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 5
+REPLICA_COOKIE_NAME = 'use_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -144,8 +164,63 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+# Общий кэш из CACHE_URL (по умолчанию память процесса) и перед ним
+# LRU в памяти процесса для фрагментов лент, см. yatube.caches
+CACHES = caches_from_env('locmem://')
+
+# Лента постов
+
+POSTS_PER_PAGE = 10
+# Число постов лент для номеров страниц (posts.feed_counts) хранится
+# в кэше и пересчитывается в фоне ('thread') или сразу ('sync'), если
+# старше FEED_COUNT_TIMEOUT секунд
+FEED_COUNT_TIMEOUT = 60
+FEED_COUNT_REFRESH = 'thread'
+# Комментариев на странице поста; остальные подгружаются по курсору
+COMMENTS_PER_PAGE = 20
+# Ленты, которые листаются по курсору (?after=/?before=) вместо ?page=:
+# 'index', 'group', 'profile', 'follow_index'
+CURSOR_PAGINATED_FEEDS = ()
+# Фрагменты лент сбрасываются явно при изменении постов,
+# таймаут лишь ограничивает время жизни забытых ключей
+FEED_CACHE_TIMEOUT = 60 * 10
+# Карточки постов (posts.cards) получают новый ключ при изменении,
+# таймаут лишь ограничивает время жизни старых
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# Кэш сообществ по slug и авторов по имени (posts.lookups): найденные
+# сбрасываются при изменении, отсутствующие хранятся недолго
+LOOKUP_CACHE_TIMEOUT = 60 * 60
+LOOKUP_MISS_TIMEOUT = 30
+
+# Ленты «Популярное» и «Обсуждаемое» (posts.trending): вклад поста и
+# каждого комментария в рейтинг затухает вдвое за TRENDING_HALF_LIFE
+# секунд. Команда refresh_trending пересчитывает рейтинги за
+# TRENDING_WINDOW секунд и убирает посты без активности
+TRENDING_HALF_LIFE = 60 * 60 * 12
+TRENDING_POST_WEIGHT = 1.0
+TRENDING_WINDOW = 60 * 60 * 24 * 7
+
+# Материализованная лента подписок (posts.timeline). После включения
+# ленты собираются командой rebuild_timelines
+FOLLOW_TIMELINE_ENABLED = False
+# Посты авторов с большим числом подписчиков читаются напрямую
+FOLLOW_TIMELINE_FANOUT_LIMIT = 5000
+
+# Миниатюры картинок постов (posts.thumbnails): имя размера -> геометрия
+# и опции sorl-thumbnail. Создаются заранее после сохранения поста
+POST_THUMBNAIL_SIZES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
 }
+# 'thread' — пул фоновых потоков процесса, 'sync' — сразу в запросе
+THUMBNAIL_QUEUE_BACKEND = 'thread'
+THUMBNAIL_WORKERS = 2
+# Сколько не пытаться снова создать миниатюры картинки после ошибки
+THUMBNAIL_RETRY_TIMEOUT = 60 * 60
+
+# Профилирование запросов (posts.profiling): доля запросов в выборке,
+# 0 — промежуточный слой отключён. Результаты — на странице админки
+# «Профилирование» и в заголовке Server-Timing: для сотрудников или,
+# при PROFILING_SERVER_TIMING, для всех
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_BUFFER_SIZE = 200
+PROFILING_SERVER_TIMING = False
@@ -19,8 +19,15 @@ from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 
+from posts.views import profiling_report
+
 
 urlpatterns = [
+    path(
+        'admin/profiling/',
+        profiling_report,
+        name='profiling_report'
+    ),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('', include('posts.urls')),